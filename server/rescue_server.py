@@ -1,9 +1,1991 @@
 import http.server
 import os
 import datetime
+import hashlib
+import heapq
+import html
+import json
+import re
+import threading
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Feature: Concurrent Serving (US: one slow client must not stall the fleet)
+# Every write into evidence/<ip>/ or audit_logs/<ip>/ goes through the lock of that client.
+_client_locks = {}
+_client_locks_guard = threading.Lock()
+
+def client_lock(pc_ip):
+    """Returns the lock serialising writes for one client IP."""
+    with _client_locks_guard:
+        lock = _client_locks.get(pc_ip)
+        if lock is None:
+            lock = _client_locks[pc_ip] = threading.RLock()
+        return lock
+
+def claim_evidence_path(directory, timestamp, filename):
+    """Atomically reserves a timestamped file name so parallel uploads never overwrite each other."""
+    candidate = Path(directory) / f"{timestamp}_{filename}"
+    counter = 1
+    while True:
+        try:
+            fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            os.close(fd)
+            return candidate
+        except FileExistsError:
+            candidate = Path(directory) / f"{timestamp}.{counter}_{filename}"
+            counter += 1
+
+class PooledHTTPServer(http.server.HTTPServer):
+    """
+    HTTPServer that hands each connection to a bounded pool of worker threads.
+    When all workers are busy, new connections wait in the kernel accept backlog.
+    Workers are daemon threads: after /shutdown the process exits without waiting
+    for held requests (long-polls, event streams) to finish.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers=64):
+        import queue
+        # Created before binding: server_close() runs if the bind fails
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers)
+        self._requests = queue.SimpleQueue()
+        self._closed = False
+        self._threads = []
+        super().__init__(server_address, handler_class)
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker, name=f"rescue-worker-{i}", daemon=True)
+            self._threads.append(worker)
+            worker.start()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        if self._closed:
+            self._slots.release()
+            self.shutdown_request(request)
+            return
+        self._requests.put((request, client_address))
+
+    def _worker(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._closed = True
+        for _ in self._threads:
+            self._requests.put(None)
+
+class ManifestCache:
+    """
+    Incrementally maintained Smart Sync manifest.
+    Files are only re-hashed when their (mtime, size) changes, and the JSON body
+    plus its ETag are precomputed so /manifest/ requests never touch the disk.
+    """
+
+    WATCH_INTERVAL = 2.0  # seconds between watcher scans
+
+    def __init__(self, dirs=("scripts", "templates/web"), protocol_version=""):
+        self.dirs = dirs
+        self.protocol_version = protocol_version
+        self._entries = {}  # rel_path -> (mtime_ns, size, md5)
+        self._lock = threading.Lock()
+        self._body = b""
+        self._etag = ""
+        self._last_scan = 0.0
+        self._watcher = None
+        self._changed = threading.Condition()
+        self._closed = False
+
+    @staticmethod
+    def _hash_file(path):
+        hasher = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def refresh(self):
+        """Re-stats the watched trees and re-hashes only files that changed. Returns True on change."""
+        with self._lock:
+            entries = {}
+            changed = False
+            for d in self.dirs:
+                path = Path(d)
+                if not path.exists():
+                    continue
+                for f in path.rglob('*'):
+                    try:
+                        if not f.is_file():
+                            continue
+                        st = f.stat()
+                        rel_path = str(f)
+                        known = self._entries.get(rel_path)
+                        if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+                            entries[rel_path] = known
+                        else:
+                            entries[rel_path] = (st.st_mtime_ns, st.st_size, self._hash_file(f))
+                            changed = True
+                    except OSError:
+                        # File vanished between listing and hashing
+                        continue
+            if entries.keys() != self._entries.keys():
+                changed = True
+            self._entries = entries
+            self._last_scan = time.monotonic()
+            if changed or not self._body:
+                self._rebuild()
+        if changed:
+            with self._changed:
+                self._changed.notify_all()
+        return changed
+
+    def _rebuild(self):
+        files = {rel_path: {"hash": h, "size": size} for rel_path, (_, size, h) in self._entries.items()}
+        manifest = {
+            "version": datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
+            "protocol_version": self.protocol_version,
+            "files": files
+        }
+        digest = hashlib.md5(json.dumps([self.protocol_version, files], sort_keys=True).encode()).hexdigest()
+        self._body = json.dumps(manifest, indent=4, sort_keys=True).encode()
+        self._etag = f'"{digest}"'
+
+    def snapshot(self):
+        """Returns (json_bytes, etag). Without a watcher, rescans when the cache is older than WATCH_INTERVAL."""
+        if self._watcher is None and time.monotonic() - self._last_scan > self.WATCH_INTERVAL:
+            self.refresh()
+        return self._body, self._etag
+
+    def file_hash(self, rel_path):
+        """Returns the cached MD5 of one manifest entry, or "" if unknown."""
+        self.snapshot()
+        entry = self._entries.get(rel_path)
+        return entry[2] if entry else ""
+
+    def close(self):
+        """Releases every wait_for_change() caller at once (server shutdown)."""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    def hashes(self, prefix=""):
+        """Returns {rel_path: md5} of the manifest entries under prefix."""
+        self.snapshot()
+        return {rel_path: entry[2] for rel_path, entry in self._entries.items() if rel_path.startswith(prefix)}
+
+    def wait_for_change(self, rel_path, since, timeout):
+        """Blocks until the hash of rel_path differs from since or timeout expires. Returns the current hash."""
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self.file_hash(rel_path)
+            remaining = deadline - time.monotonic()
+            if current != since or remaining <= 0 or self._closed:
+                return current
+            # Wake on watcher notification, re-checking at least once per scan interval
+            with self._changed:
+                self._changed.wait(min(remaining, self.WATCH_INTERVAL))
+
+    def start_watcher(self):
+        """Keeps the manifest fresh from a background thread (stat polling, no extra dependencies)."""
+        if self._watcher is not None:
+            return
+        self.refresh()
+
+        def watch():
+            while True:
+                time.sleep(self.WATCH_INTERVAL)
+                try:
+                    if self.refresh():
+                        print("[*] Manifest: script changes detected, manifest rebuilt.")
+                except Exception as e:
+                    print(f"[!] Manifest watcher error: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="manifest-watcher", daemon=True)
+        self._watcher.start()
+
+class BundleCache:
+    """
+    Gzipped tar archives of changed scripts for POST /bundle.
+    A bundle is keyed by the exact (path, hash) set it contains: after an edit the whole fleet
+    asks for the same few files, so it is built once and then served from memory (LRU).
+    """
+
+    MAX_ENTRIES = 32
+    MAX_BYTES = 64 * 1024 * 1024
+    INDEX_NAME = ".bundle.json"  # first member: {"files": {rel_path: md5}}
+
+    def __init__(self, manifest, prefix="scripts/"):
+        from collections import OrderedDict
+        self.manifest = manifest
+        self.prefix = prefix
+        self._bundles = OrderedDict()  # key -> gzipped tar bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # concurrent misses for one key build it once
+
+    def get(self, have):
+        """
+        Returns (key, body) for the files whose manifest hash differs from have[rel_path],
+        or (None, b"") when the client is up to date.
+        """
+        wanted = {p: h for p, h in self.manifest.hashes(self.prefix).items() if have.get(p) != h}
+        if not wanted:
+            return None, b""
+        key = hashlib.md5(json.dumps(sorted(wanted.items())).encode()).hexdigest()
+        with self._lock:
+            if key in self._bundles:
+                self._bundles.move_to_end(key)
+                return key, self._bundles[key]
+        with self._build_lock:
+            with self._lock:
+                if key in self._bundles:
+                    return key, self._bundles[key]
+            body, consistent = self._build(wanted)
+            if consistent:
+                self._store(key, body)
+        return key, body
+
+    def _build(self, wanted):
+        """Archives wanted; consistent is False if a file changed after the manifest scan."""
+        import io
+        import tarfile
+        contents = {}
+        for rel_path in sorted(wanted):
+            try:
+                contents[rel_path] = Path(rel_path).read_bytes()
+            except OSError:
+                continue  # removed since the last scan; the next manifest drops it
+        files = {rel_path: hashlib.md5(data).hexdigest() for rel_path, data in contents.items()}
+        consistent = files == wanted
+
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+            def add(name, data, mode):
+                info = tarfile.TarInfo(name)
+                info.size, info.mode, info.mtime = len(data), mode, int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+            add(self.INDEX_NAME, json.dumps({"files": files}).encode(), 0o644)
+            for rel_path, data in contents.items():
+                add(rel_path, data, 0o755)
+        return buf.getvalue(), consistent
+
+    def _store(self, key, body):
+        with self._lock:
+            self._bundles[key] = body
+            self._bytes += len(body)
+            while self._bundles and (len(self._bundles) > self.MAX_ENTRIES or self._bytes > self.MAX_BYTES):
+                _, evicted = self._bundles.popitem(last=False)
+                self._bytes -= len(evicted)
+
+class MultipartStreamParser:
+    """
+    Incremental multipart/form-data reader with bounded memory.
+    File parts are streamed to disk in chunks as they arrive with their MD5 computed on the fly;
+    small non-file fields are kept in memory.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    MAX_HEADER_BYTES = 16 * 1024
+    MAX_FIELD_BYTES = 1024 * 1024
+
+    def __init__(self, rfile, boundary, content_length):
+        self.rfile = rfile
+        self.remaining = content_length
+        # A leading CRLF lets the first boundary match the same delimiter as all later ones
+        self.delimiter = b"\r\n--" + boundary
+        self.buffer = bytearray(b"\r\n")
+
+    def _fill(self):
+        """Reads the next chunk of the request body into the buffer. Returns False at end of body."""
+        if self.remaining <= 0:
+            return False
+        data = self.rfile.read(min(self.CHUNK_SIZE, self.remaining))
+        if not data:
+            self.remaining = 0
+            return False
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def _skip_to_delimiter(self):
+        while True:
+            idx = self.buffer.find(self.delimiter)
+            if idx >= 0:
+                del self.buffer[:idx + len(self.delimiter)]
+                return
+            # Keep just enough bytes to match a delimiter split across chunks
+            keep = len(self.delimiter) - 1
+            if len(self.buffer) > keep:
+                del self.buffer[:len(self.buffer) - keep]
+            if not self._fill():
+                raise ValueError("Multipart boundary not found")
+
+    def _read_exact_prefix(self, size):
+        while len(self.buffer) < size:
+            if not self._fill():
+                raise ValueError("Truncated multipart body")
+
+    def _read_headers(self):
+        while True:
+            idx = self.buffer.find(b"\r\n\r\n")
+            if idx >= 0:
+                raw = bytes(self.buffer[:idx])
+                del self.buffer[:idx + 4]
+                return raw.decode("utf-8", errors="replace")
+            if len(self.buffer) > self.MAX_HEADER_BYTES:
+                raise ValueError("Multipart part headers too large")
+            if not self._fill():
+                raise ValueError("Truncated multipart headers")
+
+    def _stream_body(self, sink):
+        """Feeds part content to sink(bytes) up to the next delimiter."""
+        keep = len(self.delimiter) - 1
+        while True:
+            idx = self.buffer.find(self.delimiter)
+            if idx >= 0:
+                sink(bytes(self.buffer[:idx]))
+                del self.buffer[:idx + len(self.delimiter)]
+                return
+            if len(self.buffer) > keep:
+                sink(bytes(self.buffer[:len(self.buffer) - keep]))
+                del self.buffer[:len(self.buffer) - keep]
+            if not self._fill():
+                raise ValueError("Truncated multipart body")
+
+    def parse(self, open_file_part):
+        """
+        Consumes the whole body. open_file_part(filename) must return a Path to write a file part to.
+        Returns (files, fields): files is a list of dicts (name, filename, path, size, md5).
+        """
+        import re
+        files, fields = [], {}
+        self._skip_to_delimiter()
+        while True:
+            self._read_exact_prefix(2)
+            marker = bytes(self.buffer[:2])
+            del self.buffer[:2]
+            if marker == b"--":
+                break  # closing delimiter
+            if marker != b"\r\n":
+                raise ValueError("Malformed multipart delimiter")
+
+            headers = self._read_headers()
+            disposition = ""
+            for header_line in headers.split("\r\n"):
+                if header_line.lower().startswith("content-disposition:"):
+                    disposition = header_line.split(":", 1)[1]
+            name_match = re.search(r'(?<![\w*])name="([^"]*)"', disposition)
+            filename_match = re.search(r'filename="([^"]*)"', disposition)
+            name = name_match.group(1) if name_match else ""
+
+            if filename_match:
+                path = open_file_part(filename_match.group(1))
+                hasher = hashlib.md5()
+                size = 0
+                try:
+                    with open(path, "wb") as out:
+                        def sink(data):
+                            nonlocal size
+                            out.write(data)
+                            hasher.update(data)
+                            size += len(data)
+                        self._stream_body(sink)
+                except Exception:
+                    path.unlink(missing_ok=True)
+                    raise
+                files.append({"name": name, "filename": filename_match.group(1), "path": path,
+                              "size": size, "md5": hasher.hexdigest()})
+            else:
+                value = bytearray()
+                def sink(data):
+                    if len(value) + len(data) > self.MAX_FIELD_BYTES:
+                        raise ValueError(f"Form field '{name}' too large")
+                    value.extend(data)
+                self._stream_body(sink)
+                fields[name] = bytes(value)
+
+        # Drain any epilogue so the connection stays in a clean state
+        while self._fill():
+            self.buffer.clear()
+        return files, fields
+
+class UploadConflict(Exception):
+    """Raised when a chunk does not start at the offset the server already holds."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+class ChunkedUploadStore:
+    """
+    Resumable evidence uploads: upload_sessions/<ip>/<id>.part holds the bytes received so far,
+    <id>.json the declared filename, size and MD5. The .part size is the resume offset,
+    so sessions survive reconnects and server restarts.
+    """
+
+    def __init__(self, root="upload_sessions"):
+        self.root = Path(root)
+
+    def _paths(self, ip_addr, upload_id):
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise KeyError(upload_id)
+        session_dir = self.root / ip_addr
+        return session_dir / f"{upload_id}.part", session_dir / f"{upload_id}.json"
+
+    def _describe(self, meta, part_path):
+        return dict(meta, offset=part_path.stat().st_size if part_path.exists() else 0)
+
+    def start(self, ip_addr, filename, size, md5=""):
+        """Opens a session, resuming an unfinished one for the same file (name, size and MD5)."""
+        import secrets
+        session_dir = self.root / ip_addr
+        session_dir.mkdir(parents=True, exist_ok=True)
+        with client_lock(ip_addr):
+            for meta_path in session_dir.glob("*.json"):
+                try:
+                    with open(meta_path, "r") as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if (meta.get("filename"), meta.get("size"), meta.get("md5")) == (filename, size, md5):
+                    part_path = meta_path.with_suffix(".part")
+                    if part_path.exists() and part_path.stat().st_size > size:
+                        # Overran by an older server; it can never finish, so do not resume it
+                        part_path.unlink()
+                        meta_path.unlink(missing_ok=True)
+                        continue
+                    return self._describe(meta, part_path)
+
+            upload_id = secrets.token_hex(8)
+            part_path, meta_path = self._paths(ip_addr, upload_id)
+            meta = {"upload_id": upload_id, "filename": filename, "size": size, "md5": md5,
+                    "created": datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}
+            part_path.touch()
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+            return self._describe(meta, part_path)
+
+    def status(self, ip_addr, upload_id):
+        part_path, meta_path = self._paths(ip_addr, upload_id)
+        with open(meta_path, "r") as f:
+            return self._describe(json.load(f), part_path)
+
+    def append(self, ip_addr, upload_id, offset, rfile, length):
+        """Streams length bytes from rfile onto the session at offset. Returns the new offset."""
+        part_path, meta_path = self._paths(ip_addr, upload_id)
+        if not meta_path.exists():
+            raise KeyError(upload_id)
+        with client_lock(f"{ip_addr}/upload/{upload_id}"):
+            current = part_path.stat().st_size
+            if offset != current:
+                raise UploadConflict(current)
+            with open(meta_path, "r") as f:
+                size = json.load(f)["size"]
+            if offset + length > size:
+                raise ValueError(f"Chunk ends at byte {offset + length}, past the declared size of {size} bytes")
+            with open(part_path, "ab") as f:
+                remaining = length
+                while remaining > 0:
+                    data = rfile.read(min(65536, remaining))
+                    if not data:
+                        break
+                    f.write(data)
+                    remaining -= len(data)
+            return part_path.stat().st_size
+
+    def finish(self, ip_addr, upload_id, evidence_dir, timestamp):
+        """Verifies size and MD5, then moves the file into evidence/. Returns (path, md5)."""
+        part_path, meta_path = self._paths(ip_addr, upload_id)
+        with client_lock(f"{ip_addr}/upload/{upload_id}"):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            received = part_path.stat().st_size
+            if received != meta["size"]:
+                # The client thinks it is done, so it will not resume: start it over
+                part_path.unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                raise ValueError(f"Size mismatch: received {received} of {meta['size']} bytes")
+            md5 = ManifestCache._hash_file(part_path)
+            if meta.get("md5") and md5 != meta["md5"].lower():
+                # Corrupt data cannot be resumed: drop the session so the client starts over
+                part_path.unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                raise ValueError(f"Checksum mismatch: expected {meta['md5']}, got {md5}")
+            filename = os.path.basename(meta["filename"]) or "uploaded_file"
+            stored_path = claim_evidence_path(evidence_dir, timestamp, filename)
+            os.replace(part_path, stored_path)
+            meta_path.unlink(missing_ok=True)
+            return stored_path, md5
+
+class PasteLog:
+    """
+    Append-only store for text pastes and status lines posted to /.
+    Instead of one evidence/<ip>/<ts>_paste.txt per message, pastes are appended to
+    evidence/<ip>/.pastes/seg_NNNNNN.log (rolled at SEGMENT_BYTES) and listed in
+    index.jsonl as name -> (segment, offset, length). The names stay the ones the old
+    files had, so /evidence/<ip>/<ts>_paste.txt URLs keep working and evidence/<ip>/
+    only holds real uploads.
+    """
+
+    SEGMENT_BYTES = 8 * 1024 * 1024
+    DIR_NAME = ".pastes"
+    SUFFIX = "_paste.txt"
+
+    def __init__(self, root="evidence"):
+        self.root = Path(root)
+        self._clients = {}  # ip -> {"index": {name: (seg, offset, length)}, "seg": n, "seg_size": bytes}
+        self._guard = threading.Lock()
+
+    def _dir(self, ip_addr):
+        return self.root / ip_addr / self.DIR_NAME
+
+    def _state(self, ip_addr):
+        """Loads a client's index on first use. Callers hold client_lock(ip_addr)."""
+        with self._guard:
+            state = self._clients.get(ip_addr)
+        if state is not None:
+            return state
+        state = {"index": {}, "seg": 1, "seg_size": 0}
+        index_path = self._dir(ip_addr) / "index.jsonl"
+        if index_path.exists():
+            with open(index_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        state["index"][entry["name"]] = (entry["seg"], entry["offset"], entry["length"])
+                        state["seg"] = max(state["seg"], entry["seg"])
+                    except (ValueError, KeyError):
+                        continue  # torn final line after a crash
+        segment = self._dir(ip_addr) / f"seg_{state['seg']:06d}.log"
+        state["seg_size"] = segment.stat().st_size if segment.exists() else 0
+        with self._guard:
+            return self._clients.setdefault(ip_addr, state)
+
+    def _claim_name(self, ip_addr, state, timestamp):
+        # Same naming as claim_evidence_path, checked against both the index and legacy files
+        name, counter = f"{timestamp}{self.SUFFIX}", 1
+        while name in state["index"] or (self.root / ip_addr / name).exists():
+            name = f"{timestamp}.{counter}{self.SUFFIX}"
+            counter += 1
+        return name
+
+    def append(self, ip_addr, timestamp, text, name=None):
+        """Stores one paste and returns the evidence file name it is served under."""
+        data = text.encode("utf-8") if isinstance(text, str) else text
+        with client_lock(ip_addr):
+            state = self._state(ip_addr)
+            name = name or self._claim_name(ip_addr, state, timestamp)
+            paste_dir = self._dir(ip_addr)
+            paste_dir.mkdir(parents=True, exist_ok=True)
+            if state["seg_size"] >= self.SEGMENT_BYTES:
+                state["seg"], state["seg_size"] = state["seg"] + 1, 0
+
+            # A header line keeps segments greppable; the index points past it at the content
+            header = f"--- {name} ---\n".encode("utf-8")
+            with open(paste_dir / f"seg_{state['seg']:06d}.log", "ab") as f:
+                f.write(header + data + b"\n")
+            offset = state["seg_size"] + len(header)
+            state["seg_size"] += len(header) + len(data) + 1
+
+            with open(paste_dir / "index.jsonl", "a") as f:
+                f.write(json.dumps({"name": name, "seg": state["seg"], "offset": offset, "length": len(data)}) + "\n")
+            state["index"][name] = (state["seg"], offset, len(data))
+            return name
+
+    def read(self, ip_addr, name):
+        """Returns the bytes of a stored paste, or None if the name is unknown."""
+        if not ip_addr or "/" in ip_addr or ip_addr.startswith("."):
+            return None
+        if not (self.root / ip_addr).is_dir():
+            return None
+        with client_lock(ip_addr):
+            entry = self._state(ip_addr)["index"].get(name)
+        if entry is None:
+            return None
+        seg, offset, length = entry
+        # Segments are append-only, so reading outside the lock is safe
+        with open(self._dir(ip_addr) / f"seg_{seg:06d}.log", "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def names(self, ip_addr):
+        with client_lock(ip_addr):
+            return list(self._state(ip_addr)["index"])
+
+    def compact(self, ip_addr):
+        """Moves legacy *_paste.txt files of one client into the log under their old names."""
+        moved = 0
+        for legacy in sorted((self.root / ip_addr).glob(f"*{self.SUFFIX}")):
+            with client_lock(ip_addr):
+                if legacy.name in self._state(ip_addr)["index"]:
+                    continue
+                self.append(ip_addr, "", legacy.read_bytes(), name=legacy.name)
+                legacy.unlink()
+            moved += 1
+        return moved
+
+    def compact_all(self):
+        """Compacts every client directory (run once in the background at startup)."""
+        if not self.root.exists():
+            return 0
+        return sum(self.compact(d.name) for d in self.root.iterdir() if d.is_dir())
+
+
+class ActivityLog:
+    """
+    Rotation for audit_logs/<ip>/client_activity.log. The live file is rolled into
+    .history/<first>_<last>.log.gz when it passes ROTATE_BYTES or ROTATE_AGE, and when a
+    new bootstrap session starts (which used to truncate it), so no history is lost.
+    Segments hold one gzip member per BLOCK_BYTES of lines; index.jsonl lists each member's
+    offset and its oldest and newest timestamps, so a time window inflates only the members it
+    overlaps. Batched status lines keep their own (slightly older) stamps, so timestamps are
+    not assumed to be in file order.
+    """
+
+    ROTATE_BYTES = 4 * 1024 * 1024
+    ROTATE_AGE = 24 * 3600  # seconds since the live file's first line
+    BLOCK_BYTES = 64 * 1024
+    DIR_NAME = ".history"
+    LIVE_NAME = "client_activity.log"
+    TS_FORMAT = "%Y%m%d_%H%M%S"
+
+    def __init__(self, root="audit_logs"):
+        self.root = Path(root)
+        self._live = {}  # ip -> {"size": bytes, "started": epoch of the first line or None}
+
+    @staticmethod
+    def _line_ts(line):
+        """The [YYYYmmdd_HHMMSS] prefix of a line, or None for a continuation line."""
+        return line[1:16] if line.startswith("[") and line[16:17] == "]" else None
+
+    def _live_state(self, ip_addr):
+        """Stats the live file on first use. Callers hold client_lock(ip_addr)."""
+        state = self._live.get(ip_addr)
+        if state is None:
+            live = self.root / ip_addr / self.LIVE_NAME
+            state = {"size": 0, "started": None}
+            if live.exists():
+                state["size"] = live.stat().st_size
+                with open(live, "r", errors="replace") as f:
+                    first_ts = self._line_ts(f.readline())
+                try:
+                    state["started"] = time.mktime(time.strptime(first_ts, self.TS_FORMAT)) if first_ts else None
+                except ValueError:
+                    pass
+            self._live[ip_addr] = state
+        return state
+
+    def append(self, ip_addr, entries, new_session=False):
+        """Writes (timestamp, text) entries to the live log, rotating it first when due. Callers hold client_lock."""
+        data = "".join(f"[{timestamp}] {text}\n" for timestamp, text in entries)
+        state = self._live_state(ip_addr)
+        if state["size"] and (new_session or state["size"] + len(data) > self.ROTATE_BYTES
+                              or (state["started"] and time.time() - state["started"] > self.ROTATE_AGE)):
+            self.rotate(ip_addr)
+            state = self._live[ip_addr]
+        audit_dir = self.root / ip_addr
+        audit_dir.mkdir(parents=True, exist_ok=True)
+        with open(audit_dir / self.LIVE_NAME, "a") as al:
+            al.write(data)
+            state["size"] = al.tell()
+        if state["started"] is None:
+            state["started"] = time.time()
+
+    def rotate(self, ip_addr):
+        """Compresses the live file into a new history segment and starts an empty one. Callers hold client_lock."""
+        import gzip
+        live = self.root / ip_addr / self.LIVE_NAME
+        with open(live, "r", errors="replace") as f:
+            lines = f.readlines()
+        self._live[ip_addr] = {"size": 0, "started": None}
+        if not lines:
+            live.unlink()
+            return
+
+        blocks, members, block, block_size = [], [], [], 0
+        block_min = block_max = None
+        first = last = current = None
+        offset = 0
+        for line in lines + [None]:
+            ts = self._line_ts(line) if line is not None else None
+            # Members only start on a stamped line, so a reader can begin at any of them
+            if block and (line is None or (ts and block_size >= self.BLOCK_BYTES)):
+                member = gzip.compress("".join(block).encode("utf-8"), mtime=0)
+                blocks.append([block_min, offset, block_max])
+                members.append(member)
+                offset += len(member)
+                block, block_size, block_min, block_max = [], 0, None, None
+            if line is None:
+                break
+            # Continuation lines belong to the previous timestamp
+            current = ts or current
+            if current:
+                first, last = min(first or current, current), max(last or current, current)
+                block_min, block_max = min(block_min or current, current), max(block_max or current, current)
+            block.append(line)
+            block_size += len(line)
+
+        history = self.root / ip_addr / self.DIR_NAME
+        history.mkdir(exist_ok=True)
+        name, counter = f"{first or 'undated'}_{last or 'undated'}.log.gz", 1
+        while (history / name).exists():
+            name = f"{first or 'undated'}_{last or 'undated'}.{counter}.log.gz"
+            counter += 1
+        tmp = history / (name + ".tmp")
+        with open(tmp, "wb") as f:
+            for member in members:
+                f.write(member)
+        os.replace(tmp, history / name)
+        with open(history / "index.jsonl", "a") as f:
+            f.write(json.dumps({"segment": name, "first": first, "last": last, "lines": len(lines),
+                                "bytes": offset, "blocks": blocks}) + "\n")
+        live.unlink()
+        print(f"[*] Activity log of {ip_addr} rotated into {self.DIR_NAME}/{name} ({len(lines)} lines).")
+
+    def segments(self, ip_addr):
+        """The history index of one client, oldest first."""
+        index_path = self.root / ip_addr / self.DIR_NAME / "index.jsonl"
+        entries = []
+        if index_path.exists():
+            with open(index_path, "r") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # torn final line after a crash
+        return entries
+
+    def read_window(self, ip_addr, start=None, end=None, limit=5000):
+        """
+        Returns (lines, truncated): up to limit lines stamped within [start, end] (YYYYmmdd_HHMMSS
+        strings, either open), in log order, from the history segments and then the live file.
+        """
+        import gzip
+        lines = []
+
+        def take(chunk):
+            # Filters lines by timestamp; returns True once the limit is exceeded
+            current_ts = None
+            for line in chunk:
+                current_ts = self._line_ts(line) or current_ts
+                if current_ts is None or (start and current_ts < start) or (end and current_ts > end):
+                    continue
+                if len(lines) >= limit:
+                    return True
+                lines.append(line)
+            return False
+
+        outside = lambda low, high: (start and high and high < start) or (end and low and low > end)
+        history = self.root / ip_addr / self.DIR_NAME
+        for entry in self.segments(ip_addr):
+            if outside(entry["first"], entry["last"]):
+                continue
+            with open(history / entry["segment"], "rb") as f:
+                blocks = entry["blocks"]
+                for i, (low, member_start, high) in enumerate(blocks):
+                    if outside(low, high):
+                        continue
+                    f.seek(member_start)
+                    member_end = blocks[i + 1][1] if i + 1 < len(blocks) else entry["bytes"]
+                    chunk = gzip.decompress(f.read(member_end - member_start)).decode("utf-8", "replace")
+                    if take(chunk.splitlines(keepends=True)):
+                        return lines, True
+        live = self.root / ip_addr / self.LIVE_NAME
+        if live.exists():
+            with open(live, "r", errors="replace") as f:
+                take(f)
+        return lines, len(lines) >= limit
+
+
+class ProxyCache:
+    """
+    Content-addressed download cache for /proxy.
+    Entries are stored as <sha256(url)>.bin and described in index.json (URL, size, ETag,
+    Last-Modified, access times), so startup needs no directory scan. Concurrent misses for the same
+    URL share one download, files are published with an atomic rename, and least recently used
+    entries are evicted once the cache grows past max_bytes.
+    """
+
+    REVALIDATE_AFTER = 24 * 3600  # seconds before a hit is revalidated with the origin
+    OFFLINE_RETRY = 300           # seconds a stale copy is served without retrying an unreachable origin
+    DOWNLOAD_TIMEOUT = 30
+
+    def __init__(self, root, max_bytes=20 * 1024 ** 3):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> threading.Event set when the download finishes
+        self._index = None
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def path_for(self, key):
+        return self.root / f"{key}.bin"
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        index = {}
+        try:
+            with open(self.root / "index.json", "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+        # Drop entries whose data file disappeared
+        self._index = {k: v for k, v in index.items() if self.path_for(k).exists()}
+
+    def _save_index(self):
+        tmp_path = self.root / f".index.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.root / "index.json")
+
+    def _evict(self, keep_key):
+        total = sum(e["size"] for e in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep_key or key in self._inflight:
+                continue
+            print(f"[*] Proxy: Evicting {entry['url']} ({entry['size']} bytes)")
+            self.path_for(key).unlink(missing_ok=True)
+            total -= entry["size"]
+            del self._index[key]
+
+    def _download(self, job, stale):
+        """
+        Background download of job.url (conditional when a stale copy exists). Bytes are appended to
+        job.tmp_path and announced to readers as they arrive, then published with an atomic rename.
+        """
+        import urllib.request
+        import urllib.error
+
+        key = job.key
+        request = urllib.request.Request(job.url)
+        if stale:
+            if stale.get("etag"): request.add_header("If-None-Match", stale["etag"])
+            if stale.get("last_modified"): request.add_header("If-Modified-Since", stale["last_modified"])
+
+        entry = None
+        try:
+            try:
+                response = urllib.request.urlopen(request, timeout=self.DOWNLOAD_TIMEOUT)
+            except urllib.error.HTTPError as e:
+                if e.code == 304 and stale:
+                    entry = dict(stale, fetched=time.time())
+                    return
+                raise
+            except (urllib.error.URLError, OSError):
+                if stale:
+                    # Offline rescue networks: serving a stale copy beats failing.
+                    # Negative-cached, so stale hits don't retry the origin on every request.
+                    print(f"[!] Proxy: Origin unreachable, serving cached copy of {job.url}")
+                    entry = dict(stale, retry_after=time.time() + self.OFFLINE_RETRY)
+                    job.served_stale = True
+                    return
+                raise
+
+            with response, open(job.tmp_path, "wb") as out_file:
+                length = response.headers.get("Content-Length")
+                with job.cond:
+                    job.length = int(length) if length and length.isdigit() else None
+                    job.state = "streaming"
+                    job.cond.notify_all()
+                while True:
+                    data = response.read(256 * 1024)
+                    if not data:
+                        break
+                    out_file.write(data)
+                    out_file.flush()
+                    with job.cond:
+                        job.written += len(data)
+                        job.cond.notify_all()
+                etag = response.headers.get("ETag", "")
+                last_modified = response.headers.get("Last-Modified", "")
+
+            now = time.time()
+            entry = {"url": job.url, "filename": job.filename, "size": job.written,
+                     "etag": etag, "last_modified": last_modified, "fetched": now, "last_access": now}
+            with job.cond:
+                # Renamed under the job lock so no reader opens tmp_path after it is gone
+                os.replace(job.tmp_path, self.path_for(key))
+        except Exception as e:
+            print(f"[!] Proxy: Download of {job.url} failed: {e}")
+            job.error = e
+            job.tmp_path.unlink(missing_ok=True)
+        finally:
+            with self._lock:
+                if entry is not None:
+                    entry["last_access"] = time.time()
+                    self._index[key] = entry
+                    self._evict(keep_key=key)
+                    self._save_index()
+                self._inflight.pop(key, None)
+            with job.cond:
+                job.state = "failed" if job.error else "stale" if job.served_stale else "done"
+                job.cond.notify_all()
+
+    def fetch(self, url):
+        """
+        Returns (entry, path, None) for a cached URL, or (None, None, job) while a download is
+        streaming. Concurrent misses for the same URL share one background download.
+        """
+        from urllib.parse import urlparse
+        key = self.key_for(url)
+        while True:
+            with self._lock:
+                self._load_index()
+                entry = self._index.get(key)
+                now = time.time()
+                if entry and (now - entry["fetched"] < self.REVALIDATE_AFTER or now < entry.get("retry_after", 0)):
+                    entry["last_access"] = now
+                    print(f"[*] Proxy: Cache hit for {entry['filename']}")
+                    return entry, self.path_for(key), None
+                job = self._inflight.get(key)
+                if job is None:
+                    filename = os.path.basename(urlparse(url).path) or f"{key}.bin"
+                    job = self._inflight[key] = ProxyDownload(url, key, filename,
+                                                              self.root / f".{key}.{threading.get_ident()}.part")
+                    print(f"[*] Proxy: Downloading {url}")
+                    threading.Thread(target=self._download, args=(job, entry), daemon=True).start()
+
+            with job.cond:
+                while job.state == "pending":
+                    job.cond.wait()
+                if job.state == "streaming":
+                    return None, None, job
+            if job.state == "failed":
+                raise job.error
+            if job.state == "stale":
+                # Origin unreachable: serve the copy we already had
+                with self._lock:
+                    entry = self._index.get(key)
+                if entry is None:
+                    raise OSError(f"cached copy of {url} was evicted")
+                return entry, self.path_for(key), None
+            # Finished (or revalidated) before we could attach: it is a cache hit now
+
+class ProxyDownload:
+    """An in-flight /proxy download that any number of requests can stream from while it is written."""
+
+    def __init__(self, url, key, filename, tmp_path):
+        self.url = url
+        self.key = key
+        self.filename = filename
+        self.tmp_path = tmp_path
+        self.cond = threading.Condition()
+        self.state = "pending"  # pending -> streaming -> done | failed, or pending -> stale (origin unreachable)
+        self.length = None      # origin Content-Length, if announced
+        self.written = 0
+        self.error = None
+        self.served_stale = False
+
+    def open_reader(self):
+        """Opens the partial file, or returns None if the download already completed."""
+        with self.cond:
+            if self.state != "streaming":
+                return None
+            return open(self.tmp_path, "rb")
+
+    def stream_to(self, f, out):
+        """Copies bytes to out as the download produces them. Raises if the download fails."""
+        sent = 0
+        while True:
+            with self.cond:
+                while self.written <= sent and self.state == "streaming":
+                    self.cond.wait(1.0)
+                available, state = self.written, self.state
+            if state == "failed":
+                raise self.error
+            while sent < available:
+                data = f.read(min(1024 * 1024, available - sent))
+                if not data:
+                    break
+                out.write(data)
+                sent += len(data)
+            if state == "done" and sent >= available:
+                return sent
+
+class NetworkIdentity:
+    """
+    Background-refreshed view of the Mac's own addresses plus a reverse-DNS table.
+    Page handlers only read cached values: they never fork `tailscale`/`ifconfig`
+    or wait on a resolver.
+    """
+
+    REFRESH_INTERVAL = 60      # seconds between server IP refreshes
+    DNS_TTL = 3600             # seconds a resolved PC name is trusted
+    DNS_NEGATIVE_TTL = 300     # seconds before a failed lookup is retried
+
+    def __init__(self):
+        self.local_ip = "127.0.0.1"
+        self.tailscale_ip = "N/A"
+        self._names = {}  # ip -> (name or None, expires_at)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._resolver = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rdns")
+        self._refresher = None
+
+    @staticmethod
+    def _probe_local_ip():
+        import socket
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Connect to a public IP to find the preferred local interface (no packet is sent)
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
+        finally:
+            s.close()
+
+    @staticmethod
+    def _probe_tailscale_ip():
+        import re
+        import subprocess
+        try:
+            res = subprocess.run(["tailscale", "ip", "-4"], capture_output=True, text=True, timeout=1)
+            if res.returncode == 0 and res.stdout.strip():
+                return res.stdout.split()[0]
+        except (OSError, subprocess.SubprocessError):
+            pass
+        try:
+            # Fallback: check ifconfig for 100.x.y.z addresses (Tailscale range)
+            res = subprocess.run(["ifconfig"], capture_output=True, text=True, timeout=1)
+            if res.returncode == 0:
+                matches = re.findall(r"inet (100\.[0-9]+\.[0-9]+\.[0-9]+)", res.stdout)
+                if matches:
+                    return matches[0]
+        except (OSError, subprocess.SubprocessError):
+            pass
+        return "N/A"
+
+    def refresh(self):
+        """Re-probes the local and Tailscale IPs. Returns True when either changed."""
+        local_ip, ts_ip = self._probe_local_ip(), self._probe_tailscale_ip()
+        changed = (local_ip, ts_ip) != (self.local_ip, self.tailscale_ip)
+        self.local_ip, self.tailscale_ip = local_ip, ts_ip
+        return changed
+
+    def server_ips(self):
+        """Returns the cached (local_ip, tailscale_ip) of the Mac."""
+        return self.local_ip, self.tailscale_ip
+
+    def _resolve(self, ip_addr):
+        import socket
+        try:
+            name, ttl = socket.gethostbyaddr(ip_addr)[0], self.DNS_TTL
+        except (OSError, UnicodeError):
+            name, ttl = None, self.DNS_NEGATIVE_TTL
+        with self._lock:
+            self._names[ip_addr] = (name, time.monotonic() + ttl)
+            self._pending.discard(ip_addr)
+
+    def hostname_for(self, ip_addr, default="Unknown Device"):
+        """Returns the cached reverse-DNS name of ip_addr, scheduling a lookup when missing or expired."""
+        with self._lock:
+            name, expires = self._names.get(ip_addr, (None, 0.0))
+            if expires <= time.monotonic() and ip_addr not in self._pending:
+                self._pending.add(ip_addr)
+                self._resolver.submit(self._resolve, ip_addr)
+        return name or default
+
+    def start(self):
+        """Probes once synchronously, then keeps the addresses fresh from a background thread."""
+        if self._refresher is not None:
+            return
+        self.refresh()
+
+        def loop():
+            while True:
+                time.sleep(self.REFRESH_INTERVAL)
+                try:
+                    if self.refresh():
+                        print(f"[*] Network: server IPs now {self.local_ip} / Tailscale {self.tailscale_ip}")
+                except Exception as e:
+                    print(f"[!] Network refresher error: {e}")
+
+        self._refresher = threading.Thread(target=loop, name="network-identity", daemon=True)
+        self._refresher.start()
+
+
+class SafeHTML(str):
+    """Marks an already-rendered HTML fragment so templates insert it without escaping."""
+
+
+def js_attr(value):
+    """Quotes a value as a JS string literal that is safe inside an HTML attribute."""
+    return html.escape(json.dumps(str(value)))
+
+
+class TemplateCache:
+    """
+    Precompiled HTML templates.
+    Each file is split once into static segments and {{SLOT}} names; it is only
+    re-read when its mtime changes. Rendering joins the pieces in one pass and
+    HTML-escapes every value that is not SafeHTML.
+    """
+
+    SLOT_PATTERN = re.compile(r"\{\{([A-Z_]+)\}\}")
+
+    def __init__(self, root="templates/web"):
+        self.root = Path(root)
+        self._compiled = {}  # name -> (mtime_ns, [static, slot, static, slot, ..., static])
+        self._lock = threading.Lock()
+
+    def _load(self, name):
+        path = self.root / name
+        mtime_ns = path.stat().st_mtime_ns
+        with self._lock:
+            cached = self._compiled.get(name)
+            if cached and cached[0] == mtime_ns:
+                return cached[1]
+        pieces = self.SLOT_PATTERN.split(path.read_text(encoding="utf-8"))
+        with self._lock:
+            self._compiled[name] = (mtime_ns, pieces)
+        return pieces
+
+    def render(self, name, **values):
+        """Renders a template to UTF-8 bytes. Raises FileNotFoundError if the template is missing."""
+        pieces = self._load(name)
+        out = []
+        for i, piece in enumerate(pieces):
+            if i % 2 == 0:
+                out.append(piece)
+            elif piece in values:
+                value = values[piece]
+                out.append(value if isinstance(value, SafeHTML) else html.escape(str(value)))
+            else:
+                # Unknown slots are left in place, as the old str.replace rendering did
+                out.append("{{" + piece + "}}")
+        return "".join(out).encode("utf-8")
+
+
+# Feature: Tail Reading (US: flat latency no matter how large client_activity.log grows)
+TAIL_USE_MMAP = False  # set by --tail-mmap
+
+def iter_lines_reversed(path, block_size=65536, use_mmap=None):
+    """
+    Yields the lines of a text file from last to first (each still ending in "\n"),
+    reading fixed-size blocks backwards from EOF so callers can stop early.
+    """
+    use_mmap = TAIL_USE_MMAP if use_mmap is None else use_mmap
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        if use_mmap:
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = size
+                while end > 0:
+                    # Search before end - 1 so a line's own terminator is not mistaken for its start
+                    idx = mm.rfind(b"\n", 0, end - 1)
+                    yield mm[idx + 1:end].decode("utf-8", errors="replace")
+                    end = idx + 1
+            return
+
+        pos = size
+        buffer = b""
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            buffer = f.read(read_size) + buffer
+            # Emit every complete line; the first one may continue in the previous block
+            end = len(buffer)
+            while True:
+                idx = buffer.rfind(b"\n", 0, end - 1)
+                if idx < 0:
+                    break
+                yield buffer[idx + 1:end].decode("utf-8", errors="replace")
+                end = idx + 1
+            buffer = buffer[:end]
+        if buffer:
+            yield buffer.decode("utf-8", errors="replace")
+
+def tail_lines(path, count, use_mmap=None):
+    """Returns the last count lines of a file in chronological order."""
+    lines = []
+    for line in iter_lines_reversed(path, use_mmap=use_mmap):
+        lines.append(line)
+        if len(lines) >= count:
+            break
+    lines.reverse()
+    return lines
+
+class ArtifactIndex:
+    """
+    Newest evidence artifact per (client, kind), e.g. the latest *_capabilities.json.
+    A client's directory is globbed once on first lookup; after that stored uploads are
+    reported through note_stored(), so lookups never rescan evidence/<ip>/. Parsed JSON
+    is cached per file and re-read only when its (mtime, size) changes. Only existing
+    evidence/<ip>/ directories are looked up, and both caches are bounded.
+    """
+
+    KINDS = {"capabilities": "_capabilities.json", "instructions": "_instructions.log"}
+    MAX_ENTRIES = 4096  # per cache; the oldest entry is dropped beyond this
+
+    def __init__(self, root="evidence"):
+        self.root = Path(root)
+        self._latest = {}  # (ip, kind) -> Path or None
+        self._parsed = {}  # path -> (mtime_ns, size, data)
+        self._lock = threading.Lock()
+
+    def _scan(self, ip_addr, kind):
+        # Timestamp-prefixed names: the greatest name is the newest, as with sorted(glob)
+        return max((self.root / ip_addr).glob(f"*{self.KINDS[kind]}"), default=None)
+
+    def _is_client(self, ip_addr):
+        """ip_addr (often a query parameter) names an existing evidence/<ip>/ directory."""
+        return (bool(ip_addr) and "/" not in ip_addr and "\\" not in ip_addr and not ip_addr.startswith(".")
+                and (self.root / ip_addr).is_dir())
+
+    def _remember(self, cache, key, value):
+        """Stores into a bounded cache. Callers hold _lock."""
+        cache.pop(key, None)
+        if len(cache) >= self.MAX_ENTRIES:
+            cache.pop(next(iter(cache)))
+        cache[key] = value
+
+    def latest(self, ip_addr, kind):
+        """Returns the Path of the newest artifact of a kind for a client, or None."""
+        if not self._is_client(ip_addr):
+            return None
+        key = (ip_addr, kind)
+        with self._lock:
+            path = self._latest.get(key, False)
+        if path is False or (path is not None and not path.exists()):
+            path = self._scan(ip_addr, kind)
+            with self._lock:
+                self._remember(self._latest, key, path)
+        return path
+
+    def note_stored(self, ip_addr, path):
+        """Records a newly stored evidence file if it is a newer artifact of a known kind."""
+        path = Path(path)
+        for kind, suffix in self.KINDS.items():
+            if not path.name.endswith(suffix):
+                continue
+            with self._lock:
+                current = self._latest.get((ip_addr, kind), False)
+                if current is False:
+                    return  # never looked up: the first lookup scans anyway
+                if current is None or path.name >= current.name:
+                    self._latest[(ip_addr, kind)] = path
+
+    def load_json(self, path):
+        """Parsed JSON of an artifact, cached until its mtime or size changes. Returns {} on error."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._parsed.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        with self._lock:
+            self._remember(self._parsed, path, (st.st_mtime_ns, st.st_size, data))
+        return data
+
+    def capabilities(self, ip_addr):
+        """The newest capabilities profile of a client as a dict ({} if none)."""
+        path = self.latest(ip_addr, "capabilities")
+        return self.load_json(path) if path else {}
+
+
+GENERIC_HOSTNAMES = ["ubuntu", "localhost", "debian", "live", "amnesia", "penguin"]
+
+def load_capabilities_identity(ip_addr):
+    """Reads hostname, model and Tailscale IP from the newest *_capabilities.json of a client."""
+    hostname, hw_model, tailscale_ip = "", "", "N/A"
+    cap_data = ARTIFACT_INDEX.capabilities(ip_addr)
+    if cap_data:
+        try:
+            tailscale_ip = cap_data.get("network", {}).get("tailscale_ip", "N/A")
+            hostname = cap_data.get("system", {}).get("hostname", "")
+            hw_model = cap_data.get("hardware", {}).get("system_model", "")
+            if not hw_model or hw_model == "N/A":
+                hw_model = cap_data.get("hardware", {}).get("motherboard", {}).get("product", "")
+            if not hostname:
+                hostname = cap_data.get("hostname", "")
+        except AttributeError: pass
+    return hostname, hw_model, tailscale_ip
+
+def parse_identity_line(line):
+    """Extracts (hostname, model, tailscale_ip) hints from one activity log line; missing parts are None."""
+    import re
+    hostname = hw_model = tailscale_ip = None
+    if "[CAPABILITIES]" in line and "Profile generated:" in line:
+        try:
+            parts = line.split("Profile generated:")[1].split("|")
+            hostname = parts[0].strip()
+            hw_model = parts[1].strip()
+        except: pass
+    if "[TS: " in line:
+        match = re.search(r"\[TS:\s*([0-9\.]+)\]", line)
+        if match: tailscale_ip = match.group(1).strip()
+    return hostname, hw_model, tailscale_ip
+
+def display_name_for(ip_addr, hostname, hw_model):
+    """Prefers a meaningful hostname, then the hardware model, then the IP."""
+    if hostname and hostname.lower() not in GENERIC_HOSTNAMES:
+        return hostname
+    if hw_model and hw_model != "N/A":
+        return hw_model.strip()
+    return ip_addr
+
+class EventSubscriber:
+    """One /events connection: a bounded queue filled by the broker and drained by its handler."""
+
+    DROPPED = object()  # sentinel: the subscriber fell behind and must reconnect
+
+    def __init__(self, max_queue):
+        import queue
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+
+class EventBroker:
+    """
+    Fan-out of live dashboard events to Server-Sent Events subscribers.
+    publish() never blocks: a subscriber whose queue is full is dropped instead of
+    slowing the publisher or buffering without bound. Its browser reconnects and
+    resynchronises through the /api cursors.
+    """
+
+    MAX_QUEUE = 256
+
+    def __init__(self, max_subscribers=16):
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Returns a new EventSubscriber, or None when the subscriber limit is reached."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = EventSubscriber(self.MAX_QUEUE)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event, data, event_id=None):
+        """Queues one SSE message for every subscriber, dropping the ones that are full."""
+        import queue
+        message = ""
+        if event_id is not None:
+            message += f"id: {event_id}\n"
+        message += f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        message = message.encode("utf-8")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                self._drop(subscriber)
+
+    def close(self):
+        """Ends every stream (server shutdown) and refuses new subscribers."""
+        with self._lock:
+            self.max_subscribers = 0
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._drop(subscriber)
+
+    def _drop(self, subscriber):
+        import queue
+        self.unsubscribe(subscriber)
+        subscriber.dropped = True
+        # Free the backlog and wake the handler so it closes the stream now
+        while True:
+            try:
+                subscriber.queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            subscriber.queue.put_nowait(EventSubscriber.DROPPED)
+        except queue.Full:
+            pass  # a concurrent publisher refilled it; the handler still sees dropped on its next wake
+
+
+class ClientRegistry:
+    """
+    Resident per-client state for the Command Centre.
+    Updated whenever the server writes an activity line and rebuilt from audit_logs/
+    once at startup, so rendering the feed costs O(number of PCs) rather than O(log bytes).
+    """
+
+    FEED_LINES_PER_CLIENT = 15
+    FEED_BUFFER = 500  # global activity lines kept for /api/feed?since= deltas
+    STALE_AFTER = 300  # seconds without a status line before a PC is STALE (or HUNG)
+
+    def __init__(self, audit_root="audit_logs"):
+        import secrets
+        from collections import deque
+        self.audit_root = Path(audit_root)
+        self._clients = {}
+        self._lock = threading.Lock()
+        # Every change bumps the cursor; cards carry the cursor of their last change.
+        # Cursors restart with the process, so pages also hold its epoch to tell them apart.
+        self._seq = 0
+        self.epoch = secrets.token_hex(4)
+        self._feed = deque(maxlen=self.FEED_BUFFER)  # (seq, ip, line)
+        self._feed_floor = 0  # changes up to here are no longer (or never were) in _feed
+        self._listeners = []
+
+    def _new_state(self, ip_addr, cap_identity):
+        from collections import deque
+        return {
+            "ip": ip_addr,
+            "last_msg": "Unknown",
+            "last_time": "Never",
+            "vnc_status": "STOPPED",
+            # Epoch of the newest status line; "health" is OK, STALE or HUNG (see HealthMonitor)
+            "last_seen": None,
+            "health": "OK",
+            "recent": deque(maxlen=self.FEED_LINES_PER_CLIENT),
+            # Identity from the newest capabilities JSON, then from log heuristics
+            "cap_identity": cap_identity,
+            "log_hostname": "",
+            "log_model": "",
+            "log_tailscale_ip": "N/A",
+            "vnc_diag": None,
+            "version": 0,
+        }
+
+    def _state(self, ip_addr, cap_identity=None):
+        """The state of ip_addr, created with cap_identity (read by the caller, outside the lock) if new."""
+        state = self._clients.get(ip_addr)
+        if state is None:
+            state = self._clients[ip_addr] = self._new_state(ip_addr, cap_identity or ("", "", "N/A"))
+        return state
+
+    def _apply_line(self, state, timestamp, text, keep=True):
+        if keep:
+            state["recent"].append(f"[{timestamp}] {text}\n")
+
+        if "[BOOTSTRAP]" in text or "[HEARTBEAT]" in text:
+            state["last_msg"] = text.strip()
+            state["last_time"] = timestamp
+            state["vnc_status"] = "RUNNING" if "VNC: RUNNING" in text else "STOPPED"
+            state["last_seen"], state["health"] = time.time(), "OK"
+        elif "[AGENT]" in text:
+            state["last_msg"] = text.replace("[AGENT]", "").strip()
+            state["last_time"] = timestamp
+            state["vnc_status"] = "STOPPED"
+            state["last_seen"], state["health"] = time.time(), "OK"
+
+        hostname, hw_model, tailscale_ip = parse_identity_line(text)
+        if hostname is not None: state["log_hostname"] = hostname
+        if hw_model is not None: state["log_model"] = hw_model
+        if tailscale_ip is not None: state["log_tailscale_ip"] = tailscale_ip
+
+    def add_listener(self, callback):
+        """
+        Registers callback(client, line) for every change; line is None for identity-only changes.
+        Callbacks run under the registry lock, in cursor order, and must not block.
+        """
+        self._listeners.append(callback)
+
+    def _touch(self, state, line=None):
+        self._seq += 1
+        state["version"] = self._seq
+        if self._listeners:
+            client = self._client_dict(state)
+            for callback in self._listeners:
+                try:
+                    callback(client, line)
+                except Exception as e:
+                    print(f"[!] Registry listener error: {e}")
+        return self._seq
+
+    def record(self, ip_addr, timestamp, text, reset=False):
+        """Applies one newly written activity line. reset=True mirrors a truncated log."""
+        # A new card's capabilities are read before taking the lock, which every request shares
+        cap_identity = None
+        if reset or ip_addr not in self._clients:
+            cap_identity = load_capabilities_identity(ip_addr)
+        with self._lock:
+            if reset:
+                self._clients.pop(ip_addr, None)
+            state = self._state(ip_addr, cap_identity)
+            self._apply_line(state, timestamp, text)
+            if len(self._feed) == self._feed.maxlen:
+                self._feed_floor = self._feed[0][0]
+            line = state["recent"][-1]
+            self._feed.append((self._touch(state, line), ip_addr, line))
+
+    def set_vnc_diag(self, ip_addr, probe):
+        """Stores the latest VNC probe of a known client; its outcome becomes the card's VNC status."""
+        with self._lock:
+            state = self._clients.get(ip_addr)
+            if state is None:
+                return
+            state["vnc_diag"] = probe
+            state["vnc_status"] = probe["status"]
+            self._touch(state)
+
+    @classmethod
+    def _health(cls, state, now):
+        if state["last_seen"] is None or now - state["last_seen"] <= cls.STALE_AFTER:
+            return "OK"
+        # Stale right after fetching instructions (or awaiting confirmation): it's definitely hung
+        last_msg = state["last_msg"]
+        if "[SERVER] Client fetched instructions.sh" in last_msg or "Waiting for in-browser confirmation" in last_msg:
+            return "HUNG"
+        return "STALE"
+
+    def check_health(self, ip_addr):
+        """Re-evaluates STALE/HUNG for one client. Returns (client, changed), or (None, False) if unknown."""
+        with self._lock:
+            state = self._clients.get(ip_addr)
+            if state is None:
+                return None, False
+            health = self._health(state, time.time())
+            changed = health != state["health"]
+            if changed:
+                state["health"] = health
+                self._touch(state)
+            return self._client_dict(state), changed
+
+    def client_for_host(self, host):
+        """Maps a LAN or Tailscale address back to the client it belongs to (None if unknown)."""
+        with self._lock:
+            if host in self._clients:
+                return host
+            for state in self._clients.values():
+                if self._identity(state)[2] == host:
+                    return state["ip"]
+        return None
+
+    def refresh_identity(self, ip_addr):
+        """Re-reads the capabilities profile after a new one was uploaded."""
+        identity = load_capabilities_identity(ip_addr)
+        with self._lock:
+            if ip_addr in self._clients:
+                self._clients[ip_addr]["cap_identity"] = identity
+                self._touch(self._clients[ip_addr])
+
+    def _load_log_tail(self, state, log_file):
+        """
+        Replays only what the card needs from a log: the last FEED_LINES_PER_CLIENT lines plus the
+        newest status, [CAPABILITIES] and [TS: ] lines, scanning backwards from EOF with early exit.
+        """
+        picked = []  # (distance_from_eof, line, keep_in_recent)
+        need_status = need_caps = need_ts = True
+        for distance, line in enumerate(iter_lines_reversed(log_file)):
+            in_recent = distance < self.FEED_LINES_PER_CLIENT
+            is_status = need_status and ("[BOOTSTRAP]" in line or "[HEARTBEAT]" in line or "[AGENT]" in line)
+            is_caps = need_caps and "[CAPABILITIES]" in line and "Profile generated:" in line
+            is_ts = need_ts and "[TS: " in line
+            if in_recent or is_status or is_caps or is_ts:
+                picked.append((distance, line, in_recent))
+            need_status = need_status and not is_status
+            need_caps = need_caps and not is_caps
+            need_ts = need_ts and not is_ts
+            if not in_recent and not (need_status or need_caps or need_ts):
+                break
+
+        # Apply oldest first so the newest values win, exactly as a live replay would
+        for _, line, keep in reversed(picked):
+            if not line.startswith("[") or "]" not in line:
+                # Continuation of a multi-line paste: show it, but it carries no state
+                if keep: state["recent"].append(line)
+                continue
+            head, text = line.split("]", 1)
+            self._apply_line(state, head.strip("["), text.strip(), keep=keep)
+
+    def rebuild(self):
+        """Loads every client_activity.log once (server startup) using tail reads."""
+        clients = {}
+        if self.audit_root.exists():
+            for client_dir in self.audit_root.iterdir():
+                log_file = client_dir / "client_activity.log"
+                if not client_dir.is_dir() or not log_file.exists():
+                    continue
+                # Disk reads happen outside the lock; only publishing the card takes it
+                state = self._new_state(client_dir.name, load_capabilities_identity(client_dir.name))
+                self._load_log_tail(state, log_file)
+                # Replayed lines are not fresh: date them from the log, once per PC at startup
+                try:
+                    state["last_seen"] = time.mktime(time.strptime(state["last_time"], "%Y%m%d_%H%M%S"))
+                except ValueError:
+                    state["last_seen"] = None
+                state["health"] = self._health(state, time.time())
+                with self._lock:
+                    self._clients[client_dir.name] = state
+                    self._touch(state)
+                clients[client_dir.name] = state
+        with self._lock:
+            self._clients = clients
+            self._feed.clear()
+            self._feed_floor = self._seq
+        return len(clients)
+
+    @staticmethod
+    def _identity(state):
+        hostname, hw_model, tailscale_ip = state["cap_identity"]
+        hostname = hostname or state["log_hostname"]
+        hw_model = hw_model or state["log_model"]
+        if tailscale_ip == "N/A":
+            tailscale_ip = state["log_tailscale_ip"]
+        return hostname, hw_model, tailscale_ip, display_name_for(state["ip"], hostname, hw_model)
+
+    def identity(self, ip_addr):
+        """Returns (hostname, hw_model, tailscale_ip, display_name) for any client IP."""
+        with self._lock:
+            state = self._clients.get(ip_addr)
+            if state is not None:
+                return self._identity(state)
+        hostname, hw_model, tailscale_ip = load_capabilities_identity(ip_addr)
+        return hostname, hw_model, tailscale_ip, display_name_for(ip_addr, hostname, hw_model)
+
+    @property
+    def cursor(self):
+        """The newest change number; pass it back as since= to receive only later changes."""
+        return self._seq
+
+    def _client_dict(self, state):
+        hostname, hw_model, tailscale_ip, display_name = self._identity(state)
+        return {
+            "ip": state["ip"],
+            "last_msg": state["last_msg"],
+            "last_time": state["last_time"],
+            "vnc_status": state["vnc_status"],
+            "last_seen": state["last_seen"],
+            "health": state["health"],
+            "recent": list(state["recent"]),
+            "hostname": hostname,
+            "hw_model": hw_model,
+            "tailscale_ip": tailscale_ip,
+            "display_name": display_name,
+            "vnc_diag": state["vnc_diag"],
+            "version": state["version"],
+        }
+
+    def snapshot(self):
+        """Returns a list of plain dicts (one per PC) safe to render outside the lock."""
+        with self._lock:
+            return [self._client_dict(state) for state in self._clients.values()]
+
+    def feed_since(self, since):
+        """
+        Returns (cursor, lines, complete) for the global stream after since.
+        complete is False when since is older than the buffer, or newer than the cursor (it
+        predates a server restart); the caller should then redraw.
+        """
+        with self._lock:
+            complete = self._feed_floor <= since <= self._seq
+            lines = [f"[{ip_addr}] {line}" for seq, ip_addr, line in self._feed if seq > since] if complete else []
+            return self._seq, lines, complete
+
+class HealthMonitor:
+    """
+    Flags PCs STALE/HUNG the moment ClientRegistry.STALE_AFTER passes without a status line,
+    instead of every page view re-parsing timestamps. Deadlines sit in a min-heap with at most
+    one live entry per PC; one thread sleeps until the earliest is due. Transitions are stored
+    in the registry (so they reach /events) and can optionally pulse the PC.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.auto_pulse = False
+        self._heap = []     # (deadline, ip)
+        self._pending = {}  # ip -> the deadline of its live heap entry
+        self._cond = threading.Condition()
+        self._thread = None
+        registry.add_listener(self._on_change)
+
+    def _on_change(self, client, line):
+        if client["health"] == "OK" and client["last_seen"] is not None:
+            self.schedule(client["ip"], client["last_seen"] + self.registry.STALE_AFTER)
+
+    def schedule(self, ip_addr, deadline):
+        """Queues a health check; an earlier queued check for the same PC re-queues itself when it fires."""
+        with self._cond:
+            queued = self._pending.get(ip_addr)
+            if queued is not None and queued <= deadline:
+                return
+            self._pending[ip_addr] = deadline
+            heapq.heappush(self._heap, (deadline, ip_addr))
+            self._cond.notify()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                if self._heap:
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        deadline, ip_addr = heapq.heappop(self._heap)
+                        if self._pending.get(ip_addr) == deadline:
+                            del self._pending[ip_addr]
+                            return ip_addr
+                        continue  # superseded by an earlier entry
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            ip_addr = self._next_due()
+            try:
+                client, changed = self.registry.check_health(ip_addr)
+                if client is None:
+                    continue
+                if client["health"] == "OK":
+                    # Seen again since this check was queued: wait for the new deadline
+                    self.schedule(ip_addr, client["last_seen"] + self.registry.STALE_AFTER)
+                elif changed:
+                    print(f"[!] Health: {ip_addr} is {client['health']} (last seen {client['last_time']}).")
+                    if self.auto_pulse:
+                        tailscale_ip = client["tailscale_ip"]
+                        notify_pc_async(tailscale_ip if tailscale_ip != "N/A" else ip_addr)
+            except Exception as e:
+                print(f"[!] Health monitor error: {e}")
+
+
+def pulse_pc(target_ip, timeout=2.0):
+    """
+    Pings the PC handshake server: /trigger, then the older /ping. Returns a report
+    {"target", "ok", "via", "detail", "elapsed"}; never raises.
+    """
+    import urllib.request
+
+    if target_ip == '::1' or not target_ip: target_ip = '127.0.0.1'
+    started = time.monotonic()
+    report = {"target": target_ip, "ok": False, "via": None, "detail": ""}
+    # Try Pulse Protocol port 8001, then fall back to old port 8001/ping
+    for route, route_timeout in (("trigger", timeout), ("ping", timeout / 2)):
+        url = f"http://{target_ip}:8001/{route}"
+        try:
+            print(f"[*] Pulsing PC at {url}...")
+            with urllib.request.urlopen(url, timeout=route_timeout) as r:
+                report.update(ok=True, via=route, detail=f"HTTP {r.status}")
+                break
+        except Exception as e:
+            report["detail"] = str(getattr(e, "reason", e))
+    report["elapsed"] = round(time.monotonic() - started, 3)
+    return report
+
+
+class PcNotifier:
+    """
+    Background pulses on a fixed worker pool. Per target, a pulse that is queued or in flight
+    absorbs new requests, pulses within DEDUP_WINDOW of the last one are dropped, and an
+    unreachable PC is left alone for an exponentially growing backoff (negative cache).
+    """
+
+    WORKERS = 8
+    DEDUP_WINDOW = 5.0  # seconds
+    BACKOFF_BASE = 10.0
+    BACKOFF_MAX = 600.0
+    MAX_TARGETS = 1024  # idle healthy targets are forgotten beyond this
+
+    def __init__(self):
+        self._targets = {}  # ip -> {"busy", "last_sent", "failures", "retry_after"}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix="notify")
+
+    def notify(self, target_ip, force=False):
+        """
+        Queues a pulse unless it coalesces with a pending one, falls in the dedup window or
+        the target is backing off. force (an operator's click) skips the last two checks.
+        Returns True if a pulse was queued.
+        """
+        if target_ip == '::1' or not target_ip: target_ip = '127.0.0.1'
+        now = time.monotonic()
+        with self._lock:
+            state = self._targets.setdefault(target_ip, {"busy": False, "last_sent": float("-inf"),
+                                                         "failures": 0, "retry_after": 0.0})
+            if state["busy"]:
+                return False
+            if not force and (now - state["last_sent"] < self.DEDUP_WINDOW or now < state["retry_after"]):
+                return False
+            state["busy"] = True
+            self._prune()
+        self._pool.submit(self._run, target_ip)
+        return True
+
+    def _run(self, target_ip):
+        report = {"target": target_ip, "ok": False}
+        try:
+            report = pulse_pc(target_ip)
+        finally:
+            self.record(report, busy=False)
+
+    def record(self, report, busy=None):
+        """Updates the dedup/backoff state of report["target"] from a pulse_pc() report."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._targets.setdefault(report["target"], {"busy": False, "last_sent": now,
+                                                                "failures": 0, "retry_after": 0.0})
+            state["last_sent"] = now
+            if busy is not None:
+                state["busy"] = busy
+            if report["ok"]:
+                state["failures"], state["retry_after"] = 0, 0.0
+            else:
+                state["failures"] += 1
+                backoff = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (state["failures"] - 1))
+                state["retry_after"] = now + backoff
+                if state["failures"] == 1 or backoff == self.BACKOFF_MAX:
+                    print(f"[!] Pulse: {report['target']} unreachable, backing off {int(backoff)}s.")
+
+    def _prune(self):
+        if len(self._targets) <= self.MAX_TARGETS:
+            return
+        now = time.monotonic()
+        for ip, state in list(self._targets.items()):
+            if not state["busy"] and not state["failures"] and now - state["last_sent"] > self.DEDUP_WINDOW:
+                del self._targets[ip]
+
+
+def notify_pc_async(target_ip, force=False):
+    """Tries to ping the PC handshake server in the background (see PcNotifier)."""
+    return PC_NOTIFIER.notify(target_ip, force=force)
+
+
+def pulse_fleet(clients, timeout=2.0, max_workers=32):
+    """
+    Pulses every client concurrently (at most max_workers at a time) and returns one report
+    per client, in input order. Each client is pulsed on its Tailscale IP when known.
+    """
+    def pulse_one(client):
+        tailscale_ip = client["tailscale_ip"]
+        report = pulse_pc(tailscale_ip if tailscale_ip != "N/A" else client["ip"], timeout)
+        PC_NOTIFIER.record(report)
+        return {"ip": client["ip"], "display_name": client["display_name"], **report}
+
+    if not clients:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(clients)), thread_name_prefix="pulse") as pool:
+        return list(pool.map(pulse_one, clients))
+
+
+def append_activity_lines(ip_addr, entries, mode="a"):
+    """Appends (timestamp, text) entries to audit_logs/<ip>/client_activity.log in one write and records them."""
+    with client_lock(ip_addr):
+        # mode "w" (a new bootstrap session) starts a fresh log; the old one moves to .history/
+        ACTIVITY_LOG.append(ip_addr, entries, new_session=(mode == "w"))
+        for i, (timestamp, text) in enumerate(entries):
+            CLIENT_REGISTRY.record(ip_addr, timestamp, text, reset=(mode == "w" and i == 0))
+
+
+class VncDiagService:
+    """
+    In-process VNC diagnostics. Probes run on a small thread pool using scan_hosts() from
+    scripts/vnc_diag.py (loaded as a module, reloaded when the script changes), so a click
+    no longer forks python3 or holds a request for the whole probe. A running or recent
+    (TTL) job for the same host is shared: repeated clicks never start duplicate probes.
+    """
+
+    TTL = 60          # seconds a finished result is reused for the same host
+    MAX_PARALLEL = 4  # concurrent host probes
+    KEEP_JOBS = 256   # finished jobs kept addressable by id
+
+    def __init__(self, script="scripts/vnc_diag.py"):
+        self.script = Path(script)
+        self._module = None
+        self._module_mtime = None
+        self._by_host = {}
+        self._by_id = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.MAX_PARALLEL, thread_name_prefix="vnc-diag")
+
+    def _scanner(self):
+        import importlib.util
+        mtime = self.script.stat().st_mtime_ns
+        with self._lock:
+            if self._module is None or mtime != self._module_mtime:
+                spec = importlib.util.spec_from_file_location("vnc_diag", self.script)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                self._module, self._module_mtime = module, mtime
+            return self._module
+
+    def submit(self, host, client_ip):
+        """Returns the job for host: a running one, a result younger than TTL, or a newly started probe."""
+        import secrets
+        with self._lock:
+            job = self._by_host.get(host)
+            if job and (job["state"] == "running" or time.time() - job["finished"] < self.TTL):
+                return job
+            job = {"job_id": secrets.token_hex(6), "host": host, "client": client_ip, "state": "running",
+                   "started": time.time(), "finished": 0.0, "done": threading.Event()}
+            self._by_host[host] = self._by_id[job["job_id"]] = job
+            if len(self._by_id) > self.KEEP_JOBS:
+                for old_id in [i for i, j in self._by_id.items() if j["state"] != "running"][:len(self._by_id) - self.KEEP_JOBS]:
+                    del self._by_id[old_id]
+        self._pool.submit(self._run, job)
+        return job
+
+    def job(self, job_id):
+        with self._lock:
+            return self._by_id.get(job_id)
+
+    def _run(self, job):
+        try:
+            probe = self._scanner().scan_hosts([job["host"]])[0]
+            status = probe["status"]
+            final_port = str(probe["port"] or 5900)
+            msg = f"[VNC-DIAG] VNC: {status} | Port: {final_port} | Details: {probe['detail']} ({probe['elapsed']}s)"
+            # The result lands in the probed client's log and registry state, if it is a known PC
+            if job["client"]:
+                append_activity_lines(job["client"], [(datetime.datetime.now().strftime("%Y%m%d_%H%M%S"), msg)])
+                CLIENT_REGISTRY.set_vnc_diag(job["client"], probe)
+            job.update(state="done", status=status, port=final_port, log=msg, probe=probe)
+        except Exception as e:
+            print(f"[!] VNC diagnostic for {job['host']} failed: {e}")
+            job.update(state="failed", error=str(e))
+        finally:
+            job["finished"] = time.time()
+            job["done"].set()
+
+    @staticmethod
+    def describe(job):
+        """The JSON view of a job (without its internal Event)."""
+        return {k: v for k, v in job.items() if k != "done"}
+
+
 class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     """
     Custom handler for the Rescue Server.
@@ -12,93 +1994,91 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
     CACHE_DIR = os.path.join(os.getcwd(), 'downloads_cache')
     BOOTSTRAP_VERSION = "20260123.5"  # Protocol version
-
-    def _get_client_dir(self, base_dir="evidence"):
+    INSTRUCTION_WAIT_DEFAULT = 55  # seconds an idle /instructions/wait call is held open
+    INSTRUCTION_WAIT_MAX = 300
+    # Held /instructions/wait calls, capped apart from the worker pool (main() sizes it to half of --workers)
+    LONG_POLL_SLOTS = threading.BoundedSemaphore(32)
+    # Keep-alive: agents reuse one connection per cycle; every response carries a
+    # Content-Length (or closes the connection) so the next request can follow it.
+    protocol_version = "HTTP/1.1"
+    KEEPALIVE_TIMEOUT = 15  # seconds an idle keep-alive connection may hold a worker
+    EVENTS_KEEPALIVE = 15  # seconds between SSE keepalive comments
+    STATUS_BATCH_MAX_BYTES = 1024 * 1024
+    BUNDLE_REQUEST_MAX_BYTES = 1024 * 1024
+    PULSE_TIMEOUT = 2.0      # per PC for /trigger (half that again for the /ping fallback)
+    PULSE_ALL_WORKERS = 32   # concurrent pulses for /pulse_all
+    DIAG_WAIT_MAX = 30  # seconds /diag_vnc may hold a request waiting for a probe
+
+    def _get_client_dir(self, base_dir="evidence", pc_ip=None):
         """Returns a Path object for the client-specific directory."""
-        pc_ip = self.client_address[0]
-        # Replace IPv6 loopback if encountered
-        if pc_ip == '::1': pc_ip = '127.0.0.1'
+        pc_ip = pc_ip or self._client_ip()
         client_dir = Path(base_dir) / pc_ip
         client_dir.mkdir(parents=True, exist_ok=True)
         return client_dir
 
+    def _client_ip(self):
+        """Returns the requesting client's IP with IPv6 loopback normalised."""
+        pc_ip = self.client_address[0]
+        return '127.0.0.1' if pc_ip == '::1' else pc_ip
+
+    def _append_activity(self, text, timestamp=None, ip_addr=None, mode="a"):
+        """Appends one line to audit_logs/<ip>/client_activity.log under the client's lock."""
+        timestamp = timestamp or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._append_activity_lines([(timestamp, text)], ip_addr, mode)
+
+    def _append_activity_lines(self, entries, ip_addr=None, mode="a"):
+        """Appends (timestamp, text) entries to the client's activity log in a single write."""
+        append_activity_lines(ip_addr or self._client_ip(), entries, mode)
+
     def _get_pc_identity(self, ip_addr):
         """Helper to extract hostname, model, and tailscale IP from evidence/logs."""
-        hostname = ""
-        hw_model = ""
-        tailscale_ip = "N/A"
-        
-        # 1. Try JSON evidence
-        evidence_dir = Path("evidence") / ip_addr
-        if evidence_dir.exists():
-            cap_files = sorted(list(evidence_dir.glob("*_capabilities.json")), reverse=True)
-            if cap_files:
-                try:
-                    import json
-                    with open(cap_files[0], "r") as fcap:
-                        cap_data = json.load(fcap)
-                        tailscale_ip = cap_data.get("network", {}).get("tailscale_ip", "N/A")
-                        hostname = cap_data.get("system", {}).get("hostname", "")
-                        hw_model = cap_data.get("hardware", {}).get("system_model", "")
-                        if not hw_model or hw_model == "N/A":
-                            hw_model = cap_data.get("hardware", {}).get("motherboard", {}).get("product", "")
-                        if not hostname:
-                            hostname = cap_data.get("hostname", "")
-                except: pass
-
-        # 2. Try Heuristic logs
-        log_file = Path("audit_logs") / ip_addr / "client_activity.log"
-        if log_file.exists():
-            with open(log_file, "r") as f:
-                for line in reversed(f.readlines()):
-                    if "[CAPABILITIES]" in line and "Profile generated:" in line:
-                        try: 
-                            parts = line.split("Profile generated:")[1].split("|")
-                            if not hostname: hostname = parts[0].strip()
-                            if not hw_model: hw_model = parts[1].strip()
-                        except: pass
-                    if "[TS: " in line and tailscale_ip == "N/A":
-                        import re
-                        match = re.search(r"\[TS:\s*([0-9\.]+)\]", line)
-                        if match: tailscale_ip = match.group(1).strip()
-        
-        # 3. Calculate Display Name
-        display_name = hostname if hostname else ip_addr
-        generic_names = ["ubuntu", "localhost", "debian", "live", "amnesia", "penguin"]
-        if hostname.lower() in generic_names or not hostname:
-            if hw_model and hw_model != "N/A":
-                display_name = hw_model.strip()
-            else:
-                display_name = ip_addr
-                
-        return hostname, hw_model, tailscale_ip, display_name
+        return CLIENT_REGISTRY.identity(ip_addr)
+
+    def handle_one_request(self):
+        # Between requests an idle keep-alive connection gives its worker back after KEEPALIVE_TIMEOUT
+        self.connection.settimeout(self.KEEPALIVE_TIMEOUT)
+        super().handle_one_request()
+
+    def parse_request(self):
+        # Request line received: handlers run without the idle timeout, as before keep-alive
+        self.connection.settimeout(None)
+        return super().parse_request()
+
+    def send_error(self, code, message=None, explain=None):
+        if self.command == 'POST':
+            # The request body may be partly unread; never parse it as the next request
+            self.close_connection = True
+        super().send_error(code, message, explain)
+
+    def log_error(self, format, *args):
+        if format.startswith("Request timed out"):
+            return  # an idle keep-alive connection expiring is routine
+        super().log_error(format, *args)
 
     def do_GET(self):
         # Feature: Remote Shutdown
         if self.path == '/shutdown':
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html')
-            self.end_headers()
-            self.wfile.write(b"<html><body><h1>Shutting down...</h1><p>The Rescue Server is stopping.</p></body></html>")
+            self.close_connection = True
+            self._send_body(b"<html><body><h1>Shutting down...</h1><p>The Rescue Server is stopping.</p></body></html>", 'text/html')
             print("[*] Shutdown request received. Exiting...")
+            # Held requests end now, so the port is free as soon as serve_forever() returns
+            EVENT_BROKER.close()
+            MANIFEST_CACHE.close()
             # We use a short delay to allow the response to be sent
-            import threading
             threading.Timer(1.0, self.server.shutdown).start()
             return
 
         # Case: Instruction Fetch Logging (US: Record keeping by IP)
         if self.path == '/scripts/instructions.sh':
-            client_log_dir = self._get_client_dir("audit_logs")
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            with open(client_log_dir / "client_activity.log", "a") as f:
-                f.write(f"[{timestamp}] [SERVER] Client fetched instructions.sh\n")
+            self._append_activity("[SERVER] Client fetched instructions.sh", timestamp)
             
             # Archive a copy of what was sent to this specific IP
             instr_src = Path("scripts/instructions.sh")
             if instr_src.exists():
                 client_evidence = self._get_client_dir("evidence")
                 import shutil
-                shutil.copy2(instr_src, client_evidence / f"{timestamp}_instructions_sent.sh")
+                shutil.copy2(instr_src, claim_evidence_path(client_evidence, timestamp, "instructions_sent.sh"))
 
         # Feature 004: Proxy Download Cache
         if self.path.startswith('/proxy'):
@@ -120,183 +2100,280 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self._handle_live_feed()
             return
 
+        # Feature: Live Push (US: dashboards see lines and card changes as they happen)
+        if self.path == '/events':
+            self._handle_events()
+            return
+
+        # Feature: Dashboard Deltas (US: only changed cards and new lines are sent)
+        if self.path.startswith('/api/clients'):
+            self._handle_api_clients()
+            return
+
+        if self.path.startswith('/api/feed'):
+            self._handle_api_feed()
+            return
+
         # Case: VNC Diagnostic Action
         if self.path.startswith('/diag_vnc'):
             self._handle_diag_vnc()
             return
 
+        # Feature: Instruction Long-Poll (US: agents learn about new instructions immediately)
+        if self.path.startswith('/instructions/wait'):
+            self._handle_instructions_wait()
+            return
+
         # Case: Instruction Library Page
         if self.path == '/instructions' or self.path == '/instructions/':
             self._handle_instructions()
             return
 
         # Feature: Pulse Protocol (Immediate Trigger)
+        if self.path.startswith('/pulse_all'):
+            self._handle_pulse_all()
+            return
+
         if self.path.startswith('/pulse'):
             self._handle_pulse()
             return
 
+        # Feature: Resumable Chunked Uploads (status query)
+        if self.path.startswith('/upload/status'):
+            self._handle_upload_status()
+            return
+
         # Feature: Client Detail Fetch (US: Detailed Modal Support)
         if self.path.startswith('/client_details'):
             self._handle_client_details()
             return
 
+        # Feature: Pastes kept in the paste log stay reachable under their evidence URLs
+        if self.path.startswith('/evidence/') and self._serve_logged_paste():
+            return
+
         super().do_GET()
 
-    def _get_server_ips(self):
-        """Returns the Mac server's local IP and Tailscale IP if available."""
-        import socket
-        local_ip = "Unknown"
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def _evidence_target(self):
+        """Splits /evidence/<ip>/<name> into (ip, name); name is '' for the directory itself."""
+        parts = urllib.parse.unquote(urllib.parse.urlparse(self.path).path).split('/')
+        if len(parts) == 4 and parts[1] == 'evidence':
+            return parts[2], parts[3]
+        return None, None
+
+    def _serve_logged_paste(self):
+        ip_addr, name = self._evidence_target()
+        if not name or not name.endswith(PasteLog.SUFFIX) or os.path.exists(self.translate_path(self.path)):
+            return False
+        data = PASTE_LOG.read(ip_addr, name)
+        if data is None:
+            return False
+        self._send_body(data, 'text/plain; charset=utf-8')
+        return True
+
+    def list_directory(self, path):
+        """Directory listing; evidence/<ip>/ also lists the pastes held in the paste log."""
+        ip_addr, name = self._evidence_target()
+        if not ip_addr or name:
+            return super().list_directory(path)
+        import io
         try:
-            # Connect to a public IP to find the preferred local interface
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-        except:
-            local_ip = "127.0.0.1"
-        finally:
-            s.close()
-            
-        ts_ip = "N/A"
-        try:
-            import subprocess
-            # Try to get tailscale IPv4 via CLI
-            res = subprocess.run(["tailscale", "ip", "-4"], capture_output=True, text=True, timeout=1)
-            if res.returncode == 0:
-                ts_ip = res.stdout.strip()
-            else:
-                # Fallback: check ifconfig for 100.x.y.z addresses (Tailscale range)
-                res = subprocess.run(["ifconfig"], capture_output=True, text=True, timeout=1)
-                if res.returncode == 0:
-                    import re
-                    matches = re.findall(r"inet (100\.[0-9]+\.[0-9]+\.[0-9]+)", res.stdout)
-                    if matches:
-                        ts_ip = matches[0]
-        except:
-            pass
-            
-        return local_ip, ts_ip
-
-    def _handle_live_feed(self):
-        """Displays an aggregated live activity log and PC status cards."""
+            names = [n for n in os.listdir(path) if n != PasteLog.DIR_NAME]
+        except OSError:
+            self.send_error(404, "No permission to list directory")
+            return None
+        names = [n + "/" if os.path.isdir(os.path.join(path, n)) else n for n in names]
+        names += PASTE_LOG.names(ip_addr)
+        names.sort(key=lambda a: a.lower())
+
+        title = html.escape(f"Directory listing for {urllib.parse.unquote(self.path)}", quote=False)
+        items = "\n".join(f'<li><a href="{urllib.parse.quote(n)}">{html.escape(n, quote=False)}</a></li>' for n in names)
+        body = (f'<!DOCTYPE HTML>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n</head>\n'
+                f'<body>\n<h1>{title}</h1>\n<hr>\n<ul>\n{items}\n</ul>\n<hr>\n</body>\n</html>\n').encode('utf-8')
         self.send_response(200)
-        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        
-        audit_root = Path("audit_logs")
-        feed_content = []
-        pc_cards_html = []
-        
-        if audit_root.exists():
-            for log_file in audit_root.rglob("client_activity.log"):
-                ip_addr = log_file.parent.name
-                # Skip legacy top-level log file (US: IP-based organization fix)
-                if ip_addr == "audit_logs" or ip_addr == ".": continue
-                
-                last_msg = "Unknown"
-                last_time = "Never"
-                vnc_status = "STOPPED"
-                hostname, hw_model, tailscale_ip, display_name = self._get_pc_identity(ip_addr)
-                
-                with open(log_file, "r") as f:
-                    lines = f.readlines()
-                    if lines:
-                        # Extract PC Card info from last messages
-                        for line in reversed(lines):
-                            if "[BOOTSTRAP]" in line and (not last_msg or last_msg == "Unknown"):
-                                last_msg = line.split("]", 1)[1].strip()
-                                last_time = line.split("]", 1)[0].strip("[")
-                                if "VNC: RUNNING" in line: vnc_status = "RUNNING"
-                            
-                            if "[HEARTBEAT]" in line and (not last_msg or last_msg == "Unknown"):
-                                last_msg = line.split("]", 1)[1].strip()
-                                last_time = line.split("]", 1)[0].strip("[")
-                                if "VNC: RUNNING" in line: vnc_status = "RUNNING"
-                            
-                            if "[AGENT]" in line and (not last_msg or last_msg == "Unknown"):
-                                last_msg = line.split("]", 1)[1].replace("[AGENT]", "").strip()
-                                last_time = line.split("]", 1)[0].strip("[")
-
-                        # Add to scrolling log (last 15 entries for readability)
-                        for line in lines[-15:]:
-                            feed_content.append(f"[{ip_addr}] {line}")
-
-                # Links for the card
-                instr_link = f"/evidence/{ip_addr}"
-                log_link = f"/audit_logs/{ip_addr}/client_activity.log"
-
-                # Connection IP: Prefer Tailscale for remote commands
-                conn_ip = tailscale_ip if tailscale_ip != "N/A" else ip_addr
-
-                # Hang Detection: If fetched instructions but no evidence/heartbeat recently
-                is_stale = False
-                now = datetime.datetime.now()
-                last_update_parsed = None
-                try:
-                    last_update_parsed = datetime.datetime.strptime(last_time, "%Y%m%d_%H%M%S")
-                    if (now - last_update_parsed).total_seconds() > 300: # 5 Minutes
-                        is_stale = True
-                except: pass
-
-                # If the last message was "fetched instructions" and we are stale, it's definitely hung
-                is_hung = is_stale and ("[SERVER] Client fetched instructions.sh" in last_msg or "Waiting for in-browser confirmation" in last_msg)
-
-                # Generate Card HTML with Metadata
-                status_class = "status-running" if vnc_status == "RUNNING" else "status-stopped"
-                if is_hung: status_class = "status-error status-hung"
-                elif is_stale: status_class = "status-warning"
-                
-                # Prominent display logic: Hostname + Tailscale IP
-                ts_badge = f'<span class="pc-ts-tag">{tailscale_ip}</span>' if tailscale_ip != "N/A" else ""
-                
-                card = f"""
+        return io.BytesIO(body)
+
+    def _get_server_ips(self):
+        """Returns the Mac server's local IP and Tailscale IP if available."""
+        return NETWORK_IDENTITY.server_ips()
+
+    @staticmethod
+    def _card_status(client):
+        """Returns (badge, status_class) for a client; STALE/HUNG are kept current by HEALTH_MONITOR."""
+        if client["health"] == "HUNG": return "HUNG", "status-error status-hung"
+        if client["health"] == "STALE": return "STALE", "status-warning"
+        return client["vnc_status"], "status-running" if client["vnc_status"] == "RUNNING" else "status-stopped"
+
+    @classmethod
+    def _card_fields(cls, client):
+        """The values a PC card shows, shared by the HTML render, /api/clients and /events."""
+        ip_addr = client["ip"]
+        tailscale_ip = client["tailscale_ip"]
+        badge, status_class = cls._card_status(client)
+        return {
+            "ip": ip_addr,
+            "display_name": client["display_name"],
+            "tailscale_ip": tailscale_ip,
+            # Connection IP: Prefer Tailscale for remote commands
+            "conn_ip": tailscale_ip if tailscale_ip != "N/A" else ip_addr,
+            "instr_link": f"/evidence/{ip_addr}",
+            "log_link": f"/audit_logs/{ip_addr}/client_activity.log",
+            "last_time": client["last_time"],
+            "last_msg": client["last_msg"][:65],
+            "badge": badge,
+            "status_class": status_class,
+            "version": client["version"],
+        }
+
+    def _render_pc_card(self, client):
+        """Builds the status card HTML for one ClientRegistry snapshot entry."""
+        card = self._card_fields(client)
+        ip_addr, tailscale_ip, display_name = card["ip"], card["tailscale_ip"], card["display_name"]
+        instr_link, log_link, conn_ip = card["instr_link"], card["log_link"], card["conn_ip"]
+        last_time, last_msg = card["last_time"], card["last_msg"]
+        badge, status_class = card["badge"], card["status_class"]
+
+        # Prominent display logic: Hostname + Tailscale IP
+        ts_badge = f'<span class="pc-ts-tag">{html.escape(tailscale_ip)}</span>' if tailscale_ip != "N/A" else ""
+
+        # Values reach the page as HTML text, attributes and JS string arguments; escape for each
+        e = lambda v: html.escape(str(v))
+        j = js_attr
+        return f"""
                 <div class="pc-card" 
-                     onclick="openDetails(event, '{ip_addr}', '{instr_link}', '{log_link}', '{conn_ip}', '{display_name}')"
-                     oncontextmenu="showMenu(event, '{ip_addr}', '{instr_link}', '{log_link}', '{conn_ip}')"
-                     data-ip="{ip_addr}" 
-                     data-instr="{instr_link}" 
-                     data-log="{log_link}" 
-                     data-conn="{conn_ip}" 
-                     data-name="{display_name}">
+                     onclick="openDetails(event, {j(ip_addr)}, {j(instr_link)}, {j(log_link)}, {j(conn_ip)}, {j(display_name)})"
+                     oncontextmenu="showMenu(event, {j(ip_addr)}, {j(instr_link)}, {j(log_link)}, {j(conn_ip)})"
+                     data-ip="{e(ip_addr)}" 
+                     data-instr="{e(instr_link)}" 
+                     data-log="{e(log_link)}" 
+                     data-conn="{e(conn_ip)}" 
+                     data-name="{e(display_name)}"
+                     data-version="{card['version']}">
                     <div class="pc-card-header">
                         <div class="pc-title-group">
                             <div class="pc-main-line">
-                                <span class="pc-name">{display_name}</span>
+                                <span class="pc-name">{e(display_name)}</span>
                                 {ts_badge}
                             </div>
-                            <span class="pc-ip-sub">Local: {ip_addr}</span>
+                            <span class="pc-ip-sub">Local: {e(ip_addr)}</span>
                         </div>
-                        <span class="vnc-badge {status_class}">{"HUNG" if is_hung else ("STALE" if is_stale else vnc_status)}</span>
+                        <span class="vnc-badge {status_class}">{e(badge)}</span>
                     </div>
                     <div class="pc-card-body">
-                        <div class="pc-last-seen">Last: {last_time}</div>
-                        <div class="pc-activity">{last_msg[:65]}...</div>
+                        <div class="pc-last-seen">Last: {e(last_time)}</div>
+                        <div class="pc-activity">{e(last_msg)}...</div>
                     </div>
                 </div>
                 """
-                pc_cards_html.append(card)
-        
-        # Sort and limit global log
+
+    @staticmethod
+    def _global_feed_lines(clients, limit=50):
+        """The scrolling global log: each PC's recent lines, sorted and limited."""
+        feed_content = []
+        for client in clients:
+            # Add to scrolling log (last 15 entries for readability)
+            for line in client["recent"]:
+                feed_content.append(f"[{client['ip']}] {line}")
         feed_content.sort(reverse=True)
-        log_html = "".join([f'<div class="log-entry">{l}</div>' for l in feed_content[:50]])
+        return feed_content[:limit]
+
+    def _handle_api_clients(self):
+        """
+        JSON card data for the dashboard. With since=<cursor> only cards that changed are sent
+        in full; 'status' always lists every PC's badge, since STALE/HUNG change with time alone.
+        A cursor from another epoch (before a server restart) gets every card with 'reset', so the
+        page drops the card versions it holds.
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        try:
+            since = max(0, int(query.get("since", ["0"])[0]))
+        except ValueError:
+            since = 0
+        cursor = CLIENT_REGISTRY.cursor
+        clients = CLIENT_REGISTRY.snapshot()
+        reset = query.get("epoch", [CLIENT_REGISTRY.epoch])[0] != CLIENT_REGISTRY.epoch
+        if reset:
+            since = 0
+        self._send_json({
+            "epoch": CLIENT_REGISTRY.epoch,
+            "cursor": cursor,
+            "clients": [self._card_fields(c) for c in clients if c["version"] > since],
+            "status": {c["ip"]: self._card_status(c)[0] for c in clients},
+            "reset": reset,
+        })
+
+    def _handle_api_feed(self):
+        """Global activity lines newer than since=<cursor>; 'reset' asks the page to redraw the log."""
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        try:
+            since = max(0, int(query.get("since", ["0"])[0]))
+        except ValueError:
+            since = 0
+        if query.get("epoch", [CLIENT_REGISTRY.epoch])[0] != CLIENT_REGISTRY.epoch:
+            since = -1  # a cursor from before a restart: redraw
+        cursor, lines, complete = CLIENT_REGISTRY.feed_since(since)
+        if not complete:
+            lines = self._global_feed_lines(CLIENT_REGISTRY.snapshot())
+        self._send_json({"epoch": CLIENT_REGISTRY.epoch, "cursor": cursor, "lines": lines, "reset": not complete})
+
+    def _handle_events(self):
+        """Server-Sent Events stream of new activity lines ('line') and card changes ('client')."""
+        import queue
+        subscriber = EVENT_BROKER.subscribe()
+        if subscriber is None:
+            # The dashboard falls back to polling /api/* when the stream is refused
+            self._send_json({"error": "Too many live dashboards"}, status=503)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(f"retry: 3000\nevent: hello\ndata: {json.dumps({'cursor': CLIENT_REGISTRY.cursor, 'epoch': CLIENT_REGISTRY.epoch})}\n\n".encode())
+            self.wfile.flush()
+            while not subscriber.dropped:
+                try:
+                    message = subscriber.queue.get(timeout=self.EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    # Comment line: keeps proxies from timing out and detects closed tabs
+                    message = b": keepalive\n\n"
+                if message is EventSubscriber.DROPPED:
+                    break
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            EVENT_BROKER.unsubscribe(subscriber)
+
+    def _handle_live_feed(self):
+        """Displays an aggregated live activity log and PC status cards."""
+        # Served from the resident ClientRegistry: no log files are read per request.
+        # The cursor is taken first so the page's incremental updates may repeat, never miss, a change.
+        cursor = CLIENT_REGISTRY.cursor
+        clients = CLIENT_REGISTRY.snapshot()
+        pc_cards_html = [self._render_pc_card(client) for client in clients]
+        log_html = "".join([f'<div class="log-entry">{html.escape(l)}</div>' for l in self._global_feed_lines(clients)])
         cards_html = "".join(pc_cards_html) if pc_cards_html else "<p>No PCs connected yet.</p>"
 
         # Get server IPs for the header
         local_ip, ts_ip = self._get_server_ips()
 
-        # Load template
-        template_path = Path("templates/web/live_feed.html")
-        if template_path.exists():
-            with open(template_path, "r") as f:
-                html = f.read()
-                html = html.replace("{{PC_CARDS}}", cards_html)
-                html = html.replace("{{FEED_CONTENT}}", log_html)
-                html = html.replace("{{MAC_IP}}", local_ip)
-                html = html.replace("{{MAC_TS_IP}}", ts_ip)
-        else:
-            html = f"<html><body><h1>Cards</h1>{cards_html}<h1>Log</h1><pre>{log_html}</pre></body></html>"
+        try:
+            body = TEMPLATES.render("live_feed.html", PC_CARDS=SafeHTML(cards_html), FEED_CONTENT=SafeHTML(log_html),
+                                   MAC_IP=local_ip, MAC_TS_IP=ts_ip, FEED_CURSOR=cursor,
+                                   FEED_EPOCH=CLIENT_REGISTRY.epoch)
+        except FileNotFoundError:
+            body = f"<html><body><h1>Cards</h1>{cards_html}<h1>Log</h1><pre>{log_html}</pre></body></html>".encode('utf-8')
         
         try:
-            self.wfile.write(html.encode('utf-8'))
+            self._send_body(body, 'text/html; charset=utf-8')
         except BrokenPipeError:
             # Client disconnected before we finished writing
             pass
@@ -308,84 +2385,50 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         pc_ip = self.client_address[0]
         if pc_ip == '::1': pc_ip = '127.0.0.1'
         
-        # Try to get unique name
-        import socket
-        try:
-            pc_name = socket.gethostbyaddr(pc_ip)[0]
-        except:
-            pc_name = "Unknown Device"
+        # Cached reverse DNS: the first visit may show the fallback name
+        pc_name = NETWORK_IDENTITY.hostname_for(pc_ip)
+        mac_ip, _ = NETWORK_IDENTITY.server_ips()
 
-        # Get Mac IP
-        import socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            s.connect(("8.8.8.8", 80))
-            mac_ip = s.getsockname()[0]
-        except:
-            mac_ip = "localhost"
-        finally:
-            s.close()
-
-        template_path = Path("templates/web/index.html")
-        if template_path.exists():
-            with open(template_path, "r") as f:
-                html = f.read()
-                html = html.replace("{{MAC_IP}}", mac_ip)
-                html = html.replace("{{PC_IP}}", pc_ip)
-                html = html.replace("{{PC_NAME}}", pc_name)
-                
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(html.encode('utf-8'))
-        else:
+            body = TEMPLATES.render("index.html", MAC_IP=mac_ip, PC_IP=pc_ip, PC_NAME=pc_name)
+        except FileNotFoundError:
             self.send_error(404, "index.html template missing")
+            return
+        self._send_body(body, 'text/html; charset=utf-8')
 
     def _handle_diag_vnc(self):
-        """Runs the Python VNC diagnostic tool and updates the live feed."""
+        """
+        Starts (or joins) an in-process VNC probe. ?ip=<host>[&client=<ip>][&wait=<s>] or ?job=<id>[&wait=<s>].
+        Answers 200 with the result when done, else 202 with the job id to poll.
+        """
         from urllib.parse import urlparse, parse_qs
-        import subprocess
-        
         query_components = parse_qs(urlparse(self.path).query)
-        target_ip = query_components.get('ip', [None])[0]
-        
-        if not target_ip:
-            self.send_error(400, "Missing IP parameter")
-            return
-
-        print(f"[*] Running VNC Diagnostic for {target_ip}...")
-        
-        # Run the probe
+        param = lambda key: query_components.get(key, [None])[0]
         try:
-            cmd = ["python3", "scripts/vnc_diag.py", target_ip]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
-            output = result.stdout
-            
-            # Parse port from output "RESULT: 5901 | ..."
-            final_port = "5900"
-            if "RESULT:" in output and "FAIL" not in output:
-                res_line = [l for l in output.split("\n") if "RESULT:" in l][0]
-                final_port = res_line.split(":")[1].split("|")[0].strip()
-                status = "RUNNING"
-            else:
-                status = "STOPPED"
-
-            # Log to client activity log
-            audit_dir = self._get_client_dir("audit_logs")
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            msg = f"[VNC-DIAG] VNC: {status} | Port: {final_port} | Details: {output.strip().replace('\n', ' ')}"
-            
-            with open(audit_dir / "client_activity.log", "a") as al:
-                al.write(f"[{timestamp}] {msg}\n")
+            wait = min(float(param('wait') or 0), self.DIAG_WAIT_MAX)
+        except ValueError:
+            self.send_error(400, "Invalid wait parameter")
+            return
 
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            import json
-            self.wfile.write(json.dumps({"status": status, "port": final_port, "log": msg}).encode())
+        if param('job'):
+            job = VNC_DIAG.job(param('job'))
+            if job is None:
+                self.send_error(404, "Unknown diagnostic job")
+                return
+        else:
+            target_ip = param('ip')
+            if not target_ip:
+                self.send_error(400, "Missing IP parameter")
+                return
+            # Results are only recorded for a PC the registry knows; otherwise the probe is just returned
+            client_ip = (param('client') and CLIENT_REGISTRY.client_for_host(param('client'))) \
+                or CLIENT_REGISTRY.client_for_host(target_ip)
+            job = VNC_DIAG.submit(target_ip, client_ip)
+            print(f"[*] VNC Diagnostic for {target_ip}: job {job['job_id']} ({job['state']})")
 
-        except Exception as e:
-            self.send_error(500, str(e))
+        if wait > 0:
+            job["done"].wait(wait)
+        self._send_json(VncDiagService.describe(job), status=202 if job["state"] == "running" else 200)
 
     def _handle_pulse(self):
         """Sends an immediate 'wake up' signal to the target PC."""
@@ -399,25 +2442,43 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
         # Attempt to find Tailscale IP for better reliability
         ts_ip = "N/A"
-        evidence_dir = Path("evidence") / target_ip
-        if evidence_dir.exists():
-            cap_files = sorted(list(evidence_dir.glob("*_capabilities.json")), reverse=True)
-            if cap_files:
-                try:
-                    import json
-                    with open(cap_files[0], "r") as fcap:
-                        cap_data = json.load(fcap)
-                        ts_ip = cap_data.get("network", {}).get("tailscale_ip", "N/A")
-                except: pass
+        try:
+            ts_ip = ARTIFACT_INDEX.capabilities(target_ip).get("network", {}).get("tailscale_ip", "N/A")
+        except AttributeError: pass
 
         notify_ip = ts_ip if ts_ip != "N/A" else target_ip
-        self._notify_pc_async(override_ip=notify_ip)
-        
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        import json
-        self.wfile.write(json.dumps({"message": f"Pulse signal sent to {notify_ip}"}).encode())
+        # An operator's click bypasses dedup and backoff; it only merges with a pulse in flight
+        if self._notify_pc_async(override_ip=notify_ip, force=True):
+            self._send_json({"message": f"Pulse signal sent to {notify_ip}"})
+        else:
+            self._send_json({"message": f"Pulse to {notify_ip} already in progress"})
+
+    def _handle_pulse_all(self):
+        """
+        Pulses every known PC at once and reports which acknowledged. Optional filters:
+        ip=<ip> (repeatable), health=STALE,HUNG and name=<substring of the display name>.
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        clients = CLIENT_REGISTRY.snapshot()
+        if "ip" in query:
+            clients = [c for c in clients if c["ip"] in query["ip"]]
+        if "health" in query:
+            wanted = {h.strip().upper() for h in ",".join(query["health"]).split(",")}
+            clients = [c for c in clients if c["health"] in wanted]
+        if "name" in query:
+            needle = query["name"][0].lower()
+            clients = [c for c in clients if needle in c["display_name"].lower()]
+
+        started = time.monotonic()
+        results = pulse_fleet(clients, timeout=self.PULSE_TIMEOUT, max_workers=self.PULSE_ALL_WORKERS)
+        acknowledged = sum(1 for r in results if r["ok"])
+        print(f"[*] Fleet pulse: {acknowledged}/{len(results)} PCs acknowledged.")
+        self._send_json({
+            "sent": len(results),
+            "acknowledged": acknowledged,
+            "elapsed": round(time.monotonic() - started, 3),
+            "results": results,
+        })
 
     def _handle_client_details(self):
         """Fetches detailed logs and profile info for a specific client IP."""
@@ -440,114 +2501,117 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             "capabilities": {}
         }
 
-        # 1. Fetch IP-specific Activity Log (Last 30 lines)
+        # 1. Fetch IP-specific Activity Log: a time window across the rotated history, or the last 30 lines
+        window_start = query_components.get('from', [None])[0]
+        window_end = query_components.get('to', [None])[0]
         log_path = Path("audit_logs") / target_ip / "client_activity.log"
-        if log_path.exists():
-            with open(log_path, "r") as f:
-                data["activity_log"] = f.readlines()[-30:]
-
-        # 2. Fetch Most Recent Evidence (Audit Log)
-        evidence_dir = Path("evidence") / target_ip
-        if evidence_dir.exists():
-            # Get latest instructions.log or system_audit
-            audit_files = sorted(list(evidence_dir.glob("*_instructions.log")), reverse=True)
-            if audit_files:
-                try:
-                    with open(audit_files[0], "r", encoding="utf-8", errors="ignore") as f:
-                        data["last_audit"] = f.read()
-                except: data["last_audit"] = "Could not read audit file."
+        if window_start or window_end:
+            if "/" in target_ip or target_ip.startswith("."):
+                self.send_error(400, "Invalid IP parameter")
+                return
+            with client_lock(target_ip):
+                data["activity_log"], data["truncated"] = ACTIVITY_LOG.read_window(target_ip, window_start, window_end)
+        elif log_path.exists():
+            data["activity_log"] = tail_lines(log_path, 30)
+
+        # 2. Fetch Most Recent Evidence (Audit Log), located through the artifact index
+        audit_file = ARTIFACT_INDEX.latest(target_ip, "instructions")
+        if audit_file:
+            try:
+                with open(audit_file, "r", encoding="utf-8", errors="ignore") as f:
+                    data["last_audit"] = f.read()
+            except: data["last_audit"] = "Could not read audit file."
 
-            # Get capabilities
-            cap_files = sorted(list(evidence_dir.glob("*_capabilities.json")), reverse=True)
-            if cap_files:
-                try:
-                    with open(cap_files[0], "r") as f:
-                        data["capabilities"] = json.load(f)
-                except: pass
+        # Get capabilities (parsed once per file version)
+        data["capabilities"] = ARTIFACT_INDEX.capabilities(target_ip)
 
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self._send_json(data)
 
     def _handle_instructions(self):
         """Serves the instruction library page with dynamic IP and PC name."""
         pc_ip = self.client_address[0]
         if pc_ip == '::1': pc_ip = '127.0.0.1'
         
-        # Try to get unique name
-        import socket
+        # Cached reverse DNS: the first visit may show the fallback name
+        pc_name = NETWORK_IDENTITY.hostname_for(pc_ip)
+        mac_ip, _ = NETWORK_IDENTITY.server_ips()
+
         try:
-            pc_name = socket.gethostbyaddr(pc_ip)[0]
-        except:
-            pc_name = "Unknown Device"
+            body = TEMPLATES.render("instructions.html", MAC_IP=mac_ip, PC_IP=pc_ip, PC_NAME=pc_name)
+        except FileNotFoundError:
+            self.send_error(404, "instructions.html template missing")
+            return
+        self._send_body(body, 'text/html; charset=utf-8')
 
-        # Get Mac IP
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def _handle_instructions_wait(self):
+        """
+        Long-poll for scripts/instructions.sh changes.
+        Returns 200 with the new hash as soon as it differs from ?since=, or 304 when ?timeout= expires.
+        """
+        from urllib.parse import urlparse, parse_qs
+        query_components = parse_qs(urlparse(self.path).query)
+        since = query_components.get('since', [''])[0].strip()
         try:
-            s.connect(("8.8.8.8", 80))
-            mac_ip = s.getsockname()[0]
-        except:
-            mac_ip = "localhost"
-        finally:
-            s.close()
+            timeout = float(query_components.get('timeout', [self.INSTRUCTION_WAIT_DEFAULT])[0])
+        except ValueError:
+            self.send_error(400, "Invalid timeout parameter")
+            return
+        timeout = max(0.0, min(timeout, self.INSTRUCTION_WAIT_MAX))
 
-        template_path = Path("templates/web/instructions.html")
-        if template_path.exists():
-            with open(template_path, "r") as f:
-                html = f.read()
-                html = html.replace("{{MAC_IP}}", mac_ip)
-                html = html.replace("{{PC_IP}}", pc_ip)
-                html = html.replace("{{PC_NAME}}", pc_name)
-                
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(html.encode('utf-8'))
+        if timeout == 0:
+            current = MANIFEST_CACHE.file_hash("scripts/instructions.sh")
+        elif self.LONG_POLL_SLOTS.acquire(blocking=False):
+            try:
+                current = MANIFEST_CACHE.wait_for_change("scripts/instructions.sh", since, timeout)
+            finally:
+                self.LONG_POLL_SLOTS.release()
         else:
-            self.send_error(404, "instructions.html template missing")
+            # Enough workers are already parked here; the agent falls back to its heartbeat
+            self.send_response(503)
+            self.send_header('Retry-After', '30')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if current == since:
+            self.send_response(304)
+            self.send_header('ETag', f'"{current}"')
+            self.end_headers()
+            return
+
+        body = current.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', f'"{current}"')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
 
     def _handle_manifest(self):
-        """Generates a JSON manifest of all manageable scripts and templates."""
-        import hashlib
-        import json
-        
-        manifest = {
-            "version": datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
-            "protocol_version": self.BOOTSTRAP_VERSION,
-            "files": {}
-        }
-        
-        # Scan scripts and web templates
-        dirs_to_scan = ['scripts', 'templates/web']
-        for d in dirs_to_scan:
-            path = Path(d)
-            if path.exists():
-                for f in path.rglob('*'):
-                    if f.is_file():
-                        rel_path = str(f)
-                        with open(f, "rb") as file_to_hash:
-                            f_hash = hashlib.md5(file_to_hash.read()).hexdigest()
-                        manifest["files"][rel_path] = {
-                            "hash": f_hash,
-                            "size": f.stat().st_size
-                        }
-        
+        """Serves the cached JSON manifest of all manageable scripts and templates."""
+        body, etag = MANIFEST_CACHE.snapshot()
+
+        # Conditional GET: agents that already hold this manifest get a bodiless 304
+        if_none_match = self.headers.get('If-None-Match', '')
+        if etag and etag in [t.strip().removeprefix('W/') for t in if_none_match.split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
         self.send_response(200)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
         self.end_headers()
-        self.wfile.write(json.dumps(manifest, indent=4, sort_keys=True).encode())
+        self.wfile.write(body)
 
     def _handle_proxy_request(self):
-        """Downloads a remote file to cache and serves it."""
+        """Serves a remote file through the shared download cache."""
         from urllib.parse import urlparse, parse_qs
-        import urllib.request
         import shutil
-        import hashlib
-
-        # Ensure cache exists
-        if not os.path.exists(self.CACHE_DIR):
-            os.makedirs(self.CACHE_DIR)
 
         # Parse query
         query_components = parse_qs(urlparse(self.path).query)
@@ -566,41 +2630,252 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.send_error(403, "Access to local resources denied")
             return
 
-        # Generate safe filename from URL
-        filename = os.path.basename(urlparse(target_url).path)
-        if not filename or filename == '/':
-            # If no filename in URL, hash the URL
-            filename = hashlib.md5(target_url.encode()).hexdigest() + ".bin"
-            
-        cache_path = os.path.join(self.CACHE_DIR, filename)
+        try:
+            entry, cache_path, job = PROXY_CACHE.fetch(target_url)
+            reader = job.open_reader() if job else None
+            if job and reader is None:
+                # The download completed in the meantime: serve it as a hit
+                entry, cache_path, job = PROXY_CACHE.fetch(target_url)
+            if job is None:
+                reader = open(cache_path, 'rb')
+        except Exception as e:
+            print(f"[!] Proxy Error: {e}")
+            self.send_error(500, f"Download failed: {str(e)}")
+            return
+
+        try:
+            with reader:
+                if job is not None:
+                    self._stream_proxy_download(job, reader)
+                else:
+                    self._send_cached_file(reader, entry["filename"])
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; a running download still completes into the cache
+            pass
+        except Exception as e:
+            print(f"[!] Proxy Error while streaming: {e}")
+            self.close_connection = True
+
+    def _stream_proxy_download(self, job, reader):
+        """Cache miss: tee the bytes to this client while the background download writes them."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Disposition', f'attachment; filename="{job.filename}"')
+        if job.length is not None:
+            self.send_header("Content-Length", str(job.length))
+        else:
+            # Unknown length: the end of the body is marked by closing the connection
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        job.stream_to(reader, self.wfile)
+
+    def _send_cached_file(self, f, filename):
+        """Cache hit: zero-copy send of the whole file or of a single requested byte range."""
+        file_size = os.fstat(f.fileno()).st_size
+        start, end = 0, file_size - 1
+        status = 200
+
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes=') and ',' not in range_header:
+            first, _, last = range_header[6:].strip().partition('-')
+            try:
+                if first:
+                    start = int(first)
+                    end = min(int(last), file_size - 1) if last else file_size - 1
+                else:
+                    # Suffix range: the last N bytes
+                    start = max(0, file_size - int(last))
+                valid = start <= end
+            except ValueError:
+                valid = False
+            if not valid:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{file_size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        count = end - start + 1 if file_size else 0
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+        self.send_header("Content-Length", str(count))
+        self.end_headers()
+        if count:
+            # socket.sendfile uses os.sendfile where available and falls back to send()
+            self.connection.sendfile(f, offset=start, count=count)
+
+    def _send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200):
+        self._send_body(json.dumps(data).encode(), 'application/json', status)
+
+    def _handle_upload_status(self):
+        """GET /upload/status?id=<id>: how many bytes of a resumable upload the server holds."""
+        from urllib.parse import urlparse, parse_qs
+        query_components = parse_qs(urlparse(self.path).query)
+        try:
+            self._send_json(UPLOAD_STORE.status(self._client_ip(), query_components.get('id', [''])[0]))
+        except (KeyError, OSError):
+            self.send_error(404, "Unknown upload session")
+
+    def _handle_chunked_upload(self):
+        """
+        Resumable upload protocol (POST):
+          /upload/start?filename=&size=&md5=   -> {"upload_id", "offset", ...}
+          /upload/chunk?id=&offset=            -> raw body appended at offset (409 + offset on mismatch,
+                                                  422 if it would run past the declared size)
+          /upload/finish?id=                   -> size/MD5 verified, file moved to evidence/<ip>/
+        """
+        from urllib.parse import urlparse, parse_qs
+        parsed = urlparse(self.path)
+        query_components = parse_qs(parsed.query)
+        param = lambda key, default='': query_components.get(key, [default])[0]
+        client_ip = self._client_ip()
+        content_length = int(self.headers.get('Content-Length', 0))
 
         try:
-            # Check cache
-            if not os.path.exists(cache_path):
-                print(f"[*] Proxy: Downloading {target_url} to {cache_path}")
-                # Download with timeout
-                with urllib.request.urlopen(target_url, timeout=30) as response, open(cache_path, 'wb') as out_file:
-                    shutil.copyfileobj(response, out_file)
+            if parsed.path == '/upload/start':
+                filename = os.path.basename(param('filename'))
+                if not filename:
+                    self.send_error(400, "Missing filename parameter")
+                    return
+                session = UPLOAD_STORE.start(client_ip, filename, int(param('size', '0')), param('md5').lower())
+                self._send_json(session)
+
+            elif parsed.path == '/upload/chunk':
+                upload_id = param('id')
+                new_offset = UPLOAD_STORE.append(client_ip, upload_id, int(param('offset', '0')), self.rfile, content_length)
+                self._send_json({"upload_id": upload_id, "offset": new_offset})
+
+            elif parsed.path == '/upload/finish':
+                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                stored_path, md5 = UPLOAD_STORE.finish(client_ip, param('id'), self._get_client_dir("evidence"), timestamp)
+                print(f"[*] Resumable upload complete: {stored_path} (MD5 {md5})")
+                ARTIFACT_INDEX.note_stored(client_ip, stored_path)
+                if stored_path.name.endswith("_capabilities.json"):
+                    CLIENT_REGISTRY.refresh_identity(client_ip)
+                self._send_json({"stored": stored_path.name, "md5": md5}, status=201)
+                self._notify_pc_async()
+
             else:
-                print(f"[*] Proxy: Cache hit for {filename}")
-
-            # Serve the file
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/octet-stream')
-            self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
-            file_size = os.path.getsize(cache_path)
-            self.send_header("Content-Length", str(file_size))
-            self.end_headers()
+                self.send_error(404, "Unknown upload action")
+        except UploadConflict as e:
+            # The chunk body was not read: this connection cannot carry another request
+            self.close_connection = True
+            self._send_json({"upload_id": param('id'), "offset": e.offset, "error": str(e)}, status=409)
+        except (KeyError, FileNotFoundError):
+            self.send_error(404, "Unknown upload session")
+        except ValueError as e:
+            self.send_error(422, str(e))
+
+    @staticmethod
+    def _is_session_start(text):
+        """A new bootstrap run: its first status line truncates the client's activity log."""
+        return text.startswith("[BOOTSTRAP]") and "Checking dependencies" in text
+
+    @staticmethod
+    def _should_notify(text):
+        """Only notify the PC for lines that are not just heartbeat/status updates."""
+        return not (text.startswith('[BOOTSTRAP]') or text.startswith('[VNC-STATUS]'))
+
+    def _handle_status_batch(self):
+        """
+        POST /status/batch: {"lines": [{"age": <seconds buffered>, "text": "[AGENT] ..."}, ...]}
+        Appends every line to the activity log in one write; no per-line paste evidence is kept.
+        Lines are stamped with the server's clock minus their age: live-CD clocks are often
+        hours off, so the PC's own time is never trusted.
+        """
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > self.STATUS_BATCH_MAX_BYTES:
+            self.send_error(413, "Status batch too large")
+            return
+        try:
+            lines = json.loads(self.rfile.read(content_length) or b"{}").get("lines", [])
+            now = datetime.datetime.now()
+            entries = []
+            for line in lines:
+                age = max(0.0, float(line.get("age", 0)))
+                timestamp = (now - datetime.timedelta(seconds=age)).strftime("%Y%m%d_%H%M%S")
+                entries.append((timestamp, str(line["text"])))
+        except (ValueError, AttributeError, KeyError, TypeError, OverflowError):
+            self.send_error(400, "Invalid status batch")
+            return
 
-            with open(cache_path, 'rb') as f:
-                self.wfile.write(f.read())
+        if entries:
+            # A bootstrap restart inside the batch truncates the log, as it does for single lines
+            mode = "a"
+            for i in range(len(entries) - 1, -1, -1):
+                if self._is_session_start(entries[i][1]):
+                    print(f"[*] New bootstrap detected for {self._client_ip()}. Truncating log.")
+                    entries, mode = entries[i:], "w"
+                    break
+            print(f"[*] Incoming Status batch ({self._client_ip()}): {len(entries)} lines")
+            self._append_activity_lines(entries, mode=mode)
+
+        self._send_json({"accepted": len(entries)})
+        if any(self._should_notify(text) for _, text in entries):
+            self._notify_pc_async()
 
-        except Exception as e:
-            print(f"[!] Proxy Error: {e}")
-            self.send_error(500, f"Download failed: {str(e)}")
+    def _handle_bundle(self):
+        """
+        POST /bundle: {"have": {"scripts/<name>": "<md5>", ...}}
+        Replies with one gzipped tar of every scripts/ file whose hash differs (204 if none).
+        """
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > self.BUNDLE_REQUEST_MAX_BYTES:
+            self.send_error(413, "Bundle request too large")
+            return
+        try:
+            have = json.loads(self.rfile.read(content_length) or b"{}").get("have", {})
+            have = {str(k): str(v) for k, v in have.items()}
+        except (ValueError, AttributeError):
+            self.send_error(400, "Invalid bundle request")
+            return
+
+        key, body = BUNDLE_CACHE.get(have)
+        if key is None:
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        print(f"[*] Bundle {key[:8]} ({len(body)} bytes) for {self._client_ip()}")
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', f'"{key}"')
+        self.end_headers()
+        view = memoryview(body)
+        for offset in range(0, len(view), 64 * 1024):
+            self.wfile.write(view[offset:offset + 64 * 1024])
 
     def do_POST(self):
         """Handle uploads and pastes from the client."""
+        # Feature: Resumable Chunked Uploads
+        if self.path.startswith('/upload/'):
+            self._handle_chunked_upload()
+            return
+
+        # Feature: Batched status lines from the agent
+        if self.path == '/status/batch':
+            self._handle_status_batch()
+            return
+
+        # Feature: One-request script sync
+        if self.path == '/bundle':
+            self._handle_bundle()
+            return
+
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             content_type = self.headers.get('Content-Type', '')
@@ -611,38 +2886,44 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
             # Feature: IP-based folder organization
             evidence_dir = self._get_client_dir("evidence")
-            audit_dir = self._get_client_dir("audit_logs")
             
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 
-            # Case 1: File Upload (Multi-part)
+            # Case 1: File Upload (Multi-part), streamed to disk with bounded memory
             if 'multipart/form-data' in content_type:
-                boundary = content_type.split("boundary=")[1].encode()
-                data = self.rfile.read(content_length)
-                
-                # Extract filename more robustly
-                import re
-                filename_match = re.search(b'filename="([^"]+)"', data)
-                filename = filename_match.group(1).decode() if filename_match else "uploaded_file"
-                
-                filename = os.path.basename(filename)
-                safe_filename = f"{timestamp}_{filename}"
-
-                # Find the actual content between boundaries
-                parts = data.split(b'\r\n\r\n', 1)
-                if len(parts) > 1:
-                    # Content starts after the first \r\n\r\n and ends before the next boundary
-                    content = parts[1]
-                    footer = b'\r\n--' + boundary
-                    if footer in content:
-                        content = content.split(footer)[0]
-                    
-                    with open(evidence_dir / safe_filename, "wb") as f:
-                        f.write(content)
-                    
-                    self._success_response(f"File stored as {safe_filename}")
-                else:
+                boundary = content_type.split("boundary=")[1].split(";")[0].strip().strip('"').encode()
+                parser = MultipartStreamParser(self.rfile, boundary, content_length)
+
+                def open_file_part(filename):
+                    filename = os.path.basename(filename) or "uploaded_file"
+                    return claim_evidence_path(evidence_dir, timestamp, filename)
+
+                try:
+                    files, fields = parser.parse(open_file_part)
+                except ValueError as e:
+                    self.send_error(400, f"Invalid multipart data: {e}")
+                    return
+
+                # Legacy behaviour: a form without file parts is stored as a plain upload
+                if not files and fields:
+                    stored_path = claim_evidence_path(evidence_dir, timestamp, "uploaded_file")
+                    with open(stored_path, "wb") as f:
+                        f.write(next(iter(fields.values())))
+                    files.append({"path": stored_path, "size": stored_path.stat().st_size,
+                                  "md5": hashlib.md5(stored_path.read_bytes()).hexdigest()})
+
+                if not files:
                     self.send_error(400, "Invalid multipart data")
+                    return
+
+                for stored in files:
+                    print(f"[*] Stored upload {stored['path'].name} ({stored['size']} bytes, MD5 {stored['md5']})")
+                    ARTIFACT_INDEX.note_stored(self._client_ip(), stored['path'])
+                    if stored['path'].name.endswith("_capabilities.json"):
+                        CLIENT_REGISTRY.refresh_identity(self._client_ip())
+
+                stored_names = ", ".join(f"{f['path'].name} (MD5: {f['md5']})" for f in files)
+                self._success_response(f"File stored as {stored_names}")
 
             # Case 2: Text Paste (Urlencoded)
             elif 'application/x-www-form-urlencoded' in content_type:
@@ -658,92 +2939,106 @@ class RescueHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                         # Feature: Consecutive Bootstrap Overwrite (US: Fresh session detection)
                         # If a new bootstrap run starts, truncate the audit log to avoid massive history accumulation.
                         write_mode = "a"
-                        if text_content.startswith("[BOOTSTRAP]") and "Checking dependencies" in text_content:
+                        if self._is_session_start(text_content):
                             print(f"[*] New bootstrap detected for {self.client_address[0]}. Truncating log.")
                             write_mode = "w"
 
                         # Log to IP-specific audit log
-                        audit_log = audit_dir / "client_activity.log"
-                        with open(audit_log, write_mode) as al:
-                            al.write(f"[{timestamp}] {text_content}\n")
+                        self._append_activity(text_content, timestamp, mode=write_mode)
 
-                        note_filename = f"{timestamp}_paste.txt"
-                        
-                        with open(evidence_dir / note_filename, "w") as f:
-                            f.write(text_content)
+                        # Appended to the client's paste log; still served as evidence/<ip>/<name>
+                        note_name = PASTE_LOG.append(self._client_ip(), timestamp, text_content)
                         
                         # Only notify PC if this isn't just a heartbeat/status update
-                        should_notify = not (text_content.startswith('[BOOTSTRAP]') or text_content.startswith('[VNC-STATUS]'))
-                        self._success_response(f"Text saved as {note_filename}", notify=should_notify)
+                        should_notify = self._should_notify(text_content)
+                        self._success_response(f"Text saved as {note_name}", notify=should_notify)
                     else:
                         # Fallback: if urlencoded is missing 'content', store as raw file
                         # This happens with wget --post-file if it defaults to this content-type
-                        safe_filename = f"{timestamp}_post_data.log"
-                        with open(evidence_dir / safe_filename, "wb") as f:
+                        stored_path = claim_evidence_path(evidence_dir, timestamp, "post_data.log")
+                        with open(stored_path, "wb") as f:
                             f.write(data_bytes)
-                        self._success_response(f"Data stored as {safe_filename}", notify=True)
+                        self._success_response(f"Data stored as {stored_path.name}", notify=True)
                 except UnicodeDecodeError:
                     # Binary data sent with text content-type
-                    safe_filename = f"{timestamp}_binary_post.log"
-                    with open(evidence_dir / safe_filename, "wb") as f:
+                    stored_path = claim_evidence_path(evidence_dir, timestamp, "binary_post.log")
+                    with open(stored_path, "wb") as f:
                         f.write(data_bytes)
-                    self._success_response(f"Binary data stored as {safe_filename}", notify=True)
+                    self._success_response(f"Binary data stored as {stored_path.name}", notify=True)
 
             # Case 3: Raw Binary Upload (fallback for wget --post-file)
             else:
                 data = self.rfile.read(content_length)
                 # Guess extension based on content? Or just use .log/bin
-                safe_filename = f"{timestamp}_raw_upload.log"
-                with open(evidence_dir / safe_filename, "wb") as f:
+                stored_path = claim_evidence_path(evidence_dir, timestamp, "raw_upload.log")
+                with open(stored_path, "wb") as f:
                     f.write(data)
-                self._success_response(f"Raw data stored as {safe_filename}", notify=True)
+                self._success_response(f"Raw data stored as {stored_path.name}", notify=True)
 
         except Exception as e:
             print(f"[!] POST Error: {e}")
             self.send_error(500, str(e))
 
     def _success_response(self, message, notify=False):
-        self.send_response(201)
-        self.send_header('Content-Type', 'text/html; charset=utf-8')
-        self.end_headers()
         response = f"<html><head><meta charset='UTF-8'></head><body><h2>✅ Success</h2><p>{message}</p><a href='/'>Back to Dashboard</a></body></html>"
-        self.wfile.write(response.encode('utf-8'))
+        self._send_body(response.encode('utf-8'), 'text/html; charset=utf-8', status=201)
         
         # Notify PC handshake server ONLY if requested (to avoid feedback loops)
         if notify:
             self._notify_pc_async()
 
-    def _notify_pc_async(self, override_ip=None):
-        """Tries to ping the PC handshake server in the background."""
-        import threading
-        import urllib.request
-        
-        # Determine target IP
-        target_ip = override_ip or self.client_address[0]
-        if target_ip == '::1' or not target_ip: target_ip = '127.0.0.1'
-
-        def peer_ping():
-            try:
-                # Try Pulse Protocol port 8001
-                url = f"http://{target_ip}:8001/trigger"
-                print(f"[*] Pulsing PC at {url}...")
-                with urllib.request.urlopen(url, timeout=2) as r:
-                    pass
-            except Exception:
-                # Fallback to old port 8001/ping
-                try:
-                    url = f"http://{target_ip}:8001/ping"
-                    with urllib.request.urlopen(url, timeout=1) as r:
-                        pass
-                except:
-                    pass
-
-        threading.Thread(target=peer_ping, daemon=True).start()
+    def _notify_pc_async(self, override_ip=None, force=False):
+        """Tries to ping the PC handshake server (the requester by default) in the background."""
+        return notify_pc_async(override_ip or self.client_address[0], force=force)
+
+MANIFEST_CACHE = ManifestCache(protocol_version=RescueHTTPRequestHandler.BOOTSTRAP_VERSION)
+BUNDLE_CACHE = BundleCache(MANIFEST_CACHE)
+CLIENT_REGISTRY = ClientRegistry()
+HEALTH_MONITOR = HealthMonitor(CLIENT_REGISTRY)
+UPLOAD_STORE = ChunkedUploadStore()
+PASTE_LOG = PasteLog()
+ACTIVITY_LOG = ActivityLog()
+ARTIFACT_INDEX = ArtifactIndex()
+VNC_DIAG = VncDiagService()
+PC_NOTIFIER = PcNotifier()
+PROXY_CACHE = ProxyCache(RescueHTTPRequestHandler.CACHE_DIR)
+NETWORK_IDENTITY = NetworkIdentity()
+TEMPLATES = TemplateCache()
+EVENT_BROKER = EventBroker()
+
+def publish_registry_change(client, line):
+    """ClientRegistry listener: pushes card changes and new activity lines to /events subscribers."""
+    if not EVENT_BROKER.has_subscribers:
+        return
+    card = RescueHTTPRequestHandler._card_fields(client)
+    EVENT_BROKER.publish("client", card, event_id=card["version"])
+    if line is not None:
+        EVENT_BROKER.publish("line", {"cursor": card["version"], "line": f"[{client['ip']}] {line}"}, event_id=card["version"])
+
+CLIENT_REGISTRY.add_listener(publish_registry_change)
 
 if __name__ == "__main__":
+    import argparse
+    import errno
     import sys
     import urllib.request
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+
+    parser = argparse.ArgumentParser(description="PC Rescue Station Uplink server")
+    parser.add_argument("port", nargs="?", type=int, default=8000, help="TCP port to listen on (default: 8000)")
+    parser.add_argument("--engine", choices=["threaded", "single"], default="threaded",
+                        help="threaded: bounded worker pool (default); single: legacy one-request-at-a-time HTTPServer")
+    parser.add_argument("--workers", type=int, default=64,
+                        help="Maximum concurrent requests in threaded mode (default: 64)")
+    parser.add_argument("--tail-mmap", action="store_true",
+                        help="Use mmap for reverse log reads instead of buffered block reads")
+    parser.add_argument("--cache-max-gb", type=float, default=20,
+                        help="Size cap of downloads_cache/ before LRU eviction (default: 20)")
+    parser.add_argument("--auto-pulse", action="store_true",
+                        help="Pulse a PC (port 8001) as soon as it turns STALE or HUNG")
+    args = parser.parse_args()
+    TAIL_USE_MMAP = args.tail_mmap
+    PROXY_CACHE.max_bytes = int(args.cache_max_gb * 1024 ** 3)
+    port = args.port
     
     # Feature: Automatic cleanup of existing server on same port
     try:
@@ -757,14 +3052,40 @@ if __name__ == "__main__":
         # No server running or different server type, continue
         pass
 
-    print(f"[*] Starting PC Rescue Station Uplink on port {port}...")
-    # Use HTTPServer directly for better control
+    MANIFEST_CACHE.start_watcher()
+    NETWORK_IDENTITY.start()
+    print(f"[*] Client registry rebuilt from disk ({CLIENT_REGISTRY.rebuild()} PCs).")
+    HEALTH_MONITOR.auto_pulse = args.auto_pulse
+    HEALTH_MONITOR.start()
+
+    def compact_evidence():
+        moved = PASTE_LOG.compact_all()
+        if moved:
+            print(f"[*] Evidence compaction: moved {moved} legacy paste files into paste logs.")
+    threading.Thread(target=compact_evidence, name="paste-compaction", daemon=True).start()
+
+    print(f"[*] Starting PC Rescue Station Uplink on port {port} ({args.engine} engine)...")
     server_address = ('', port)
     try:
-        httpd = http.server.HTTPServer(server_address, RescueHTTPRequestHandler)
-        httpd.serve_forever()
+        if args.engine == "threaded":
+            httpd = PooledHTTPServer(server_address, RescueHTTPRequestHandler, workers=max(1, args.workers))
+            # Each live dashboard and held long-poll keeps a worker; leave the rest for the PCs
+            EVENT_BROKER.max_subscribers = max(1, httpd.workers // 4)
+            RescueHTTPRequestHandler.LONG_POLL_SLOTS = threading.BoundedSemaphore(max(1, httpd.workers // 2))
+            print(f"[*] Serving with up to {httpd.workers} concurrent workers.")
+        else:
+            # Legacy mode: use HTTPServer directly (one request at a time)
+            EVENT_BROKER.max_subscribers = 0  # a held-open stream would block every other request
+            RescueHTTPRequestHandler.LONG_POLL_SLOTS = threading.BoundedSemaphore(0)  # so would a held long-poll
+            RescueHTTPRequestHandler.protocol_version = "HTTP/1.0"  # likewise an idle keep-alive connection
+            httpd = http.server.HTTPServer(server_address, RescueHTTPRequestHandler)
+        try:
+            httpd.serve_forever()
+        finally:
+            # Release the port right away, even while workers still finish their requests
+            httpd.server_close()
     except OSError as e:
-        if e.errno == 48:
+        if e.errno == errno.EADDRINUSE:
             print(f"[!] Error: Port {port} is still in use. Try again in a few seconds.")
             sys.exit(1)
         raise e
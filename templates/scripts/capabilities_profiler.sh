@@ -218,7 +218,14 @@ if [ -n "$MAC_IP" ]; then
     echo ""
     echo "[*] Uploading capabilities profile to server..."
     
-    if command -v curl >/dev/null 2>&1; then
+    if [ -f "./push_evidence.sh" ] && command -v curl >/dev/null 2>&1; then
+        # Resumable chunked upload with server-side MD5 verification
+        if bash ./push_evidence.sh "$OUTPUT_FILE" "http://$MAC_IP:8000" >/dev/null 2>&1; then
+            echo "✅ Upload successful"
+        else
+            echo "⚠️  Upload failed (push_evidence.sh)"
+        fi
+    elif command -v curl >/dev/null 2>&1; then
         if curl -s -F "file=@$OUTPUT_FILE" "http://$MAC_IP:8000/" >/dev/null 2>&1; then
             echo "✅ Upload successful"
         else
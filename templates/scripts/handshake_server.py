@@ -1,10 +1,12 @@
 import http.server
 import os
 import signal
+import socket
 import sys
 
 PORT = 8001
 SIGNAL_FILE = ".trigger_sync"
+AGENT_WAKE_PORT = 8002  # rescue_agent.py listens here (loopback UDP) when this server holds PORT
 
 class HandshakeHandler(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
@@ -13,6 +15,12 @@ class HandshakeHandler(http.server.BaseHTTPRequestHandler):
             # Create signal file to trigger immediate sync in bootstrap or agent
             with open(SIGNAL_FILE, "w") as f:
                 f.write("1")
+            # Wake a sleeping Python agent at once (no-op if none is listening)
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.sendto(b"pulse", ("127.0.0.1", AGENT_WAKE_PORT))
+            except OSError:
+                pass
             
             self.send_response(200)
             self.send_header('Content-Type', 'text/plain')
@@ -158,16 +158,22 @@ while true; do
         DELAY=10
     fi
 
-    # Fetch and Process Manifest
+    # Fetch current instructions hash (lightweight endpoint, full manifest as fallback)
+    NEW_INSTR_HASH=""
     if command -v curl >/dev/null 2>&1; then
-        curl -s "$MAC_SERVER_URL/manifest/" > .manifest.json
-    else
-        wget -q "$MAC_SERVER_URL/manifest/" -O .manifest.json
+        NEW_INSTR_HASH=$(curl -s -f "$MAC_SERVER_URL/instructions/wait?timeout=0" | tr -d '", ')
     fi
-
-    if [ -s ".manifest.json" ]; then
+    if [ -z "$NEW_INSTR_HASH" ]; then
+        if command -v curl >/dev/null 2>&1; then
+            curl -s "$MAC_SERVER_URL/manifest/" > .manifest.json
+        else
+            wget -q "$MAC_SERVER_URL/manifest/" -O .manifest.json
+        fi
         # Robust hash extraction (works with both compact and pretty JSON)
-        NEW_INSTR_HASH=$(grep -A 2 "scripts/instructions.sh" .manifest.json | grep "hash" | cut -d: -f2 | tr -d '", ')
+        [ -s ".manifest.json" ] && NEW_INSTR_HASH=$(grep -A 2 "scripts/instructions.sh" .manifest.json | grep "hash" | cut -d: -f2 | tr -d '", ')
+    fi
+
+    if [ -n "$NEW_INSTR_HASH" ]; then
         OLD_INSTR_HASH=$(cat .last_instr_hash 2>/dev/null | tr -d '", ')
         
         if [ -z "$OLD_INSTR_HASH" ]; then OLD_INSTR_HASH="none"; fi
@@ -236,7 +242,12 @@ while true; do
     if [ "$SYNC_REQUIRED" = "true" ]; then
         DELAY=10
     else
-        sleep $DELAY
+        # Long-poll: returns as soon as instructions.sh changes on the Mac, or after $DELAY seconds
+        LAST_HASH=$(cat .last_instr_hash 2>/dev/null | tr -d '", ')
+        if ! command -v curl >/dev/null 2>&1 || \
+           ! curl -s -f -o /dev/null -m $(( DELAY + 10 )) "$MAC_SERVER_URL/instructions/wait?since=$LAST_HASH&timeout=$DELAY"; then
+            sleep $DELAY
+        fi
         DELAY=$(( DELAY * 2 ))
         [ $DELAY -gt $MAX_DELAY ] && DELAY=$MAX_DELAY
     fi
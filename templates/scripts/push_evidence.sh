@@ -3,11 +3,15 @@
 VERSION="20260123-1030"
 echo "[*] PC Rescue Station: Evidence Uploader (v$VERSION)"
 # Standard: Bash 3.2+
-# Usage: ./push_evidence.sh <file_path>
+# Usage: ./push_evidence.sh <file_path> [server_url]
 
 FILE="$1"
+SERVER_URL="${2:-${MAC_SERVER_URL:-http://192.168.1.61:8000}}"
+CHUNK_BYTES=${CHUNK_BYTES:-1048576}
+MAX_RETRIES=10
+
 if [ -z "$FILE" ]; then
-    echo "Usage: $0 <file_path>"
+    echo "Usage: $0 <file_path> [server_url]"
     exit 1
 fi
 
@@ -16,10 +20,74 @@ if [ ! -f "$FILE" ]; then
     exit 1
 fi
 
-echo "Uploading $FILE to Mac Server (192.168.1.61)..."
+json_field() {
+    # Minimal JSON extraction for flat server replies: json_field <json> <key>
+    echo "$1" | sed -n "s/.*\"$2\": *\"\{0,1\}\([^\",}]*\).*/\1/p"
+}
+
+# Resumable chunked upload: survives flaky links by resuming from the server's offset
+# Returns 2 if the server does not support the protocol, 1 if the transfer was interrupted.
+chunked_upload() {
+    local size md5 name session upload_id offset reply next tries chunk
+    size=$(wc -c < "$FILE" | tr -d ' ')
+    md5=$(md5sum "$FILE" 2>/dev/null | awk '{print $1}')
+    [ -z "$md5" ] && md5=$(md5 -q "$FILE" 2>/dev/null)
+    name=$(basename "$FILE")
+
+    session=$(curl -s -f -X POST -G --data-urlencode "filename=$name" \
+        -d "size=$size" -d "md5=$md5" "$SERVER_URL/upload/start") || return 2
+    upload_id=$(json_field "$session" "upload_id")
+    offset=$(json_field "$session" "offset")
+    [ -z "$upload_id" ] || [ -z "$offset" ] && return 2
+    [ "$offset" -gt 0 ] && echo "[*] Resuming upload at byte $offset of $size"
+
+    tries=0
+    while [ "$offset" -lt "$size" ]; do
+        # The file may still be growing: never send past the size declared at start
+        chunk=$CHUNK_BYTES
+        [ $((size - offset)) -lt "$chunk" ] && chunk=$((size - offset))
+        reply=$(tail -c +$((offset + 1)) "$FILE" | head -c "$chunk" | \
+            curl -s -f -X POST -H "Content-Type: application/octet-stream" --data-binary @- \
+            "$SERVER_URL/upload/chunk?id=$upload_id&offset=$offset")
+        if [ $? -ne 0 ]; then
+            tries=$((tries + 1))
+            if [ $tries -gt $MAX_RETRIES ]; then
+                echo "⚠️  Upload interrupted at byte $offset. Re-run to resume."
+                return 1
+            fi
+            sleep $tries
+            # Ask the server how much it actually received
+            reply=$(curl -s -f "$SERVER_URL/upload/status?id=$upload_id") || continue
+        else
+            tries=0
+        fi
+        next=$(json_field "$reply" "offset")
+        [ -n "$next" ] && offset=$next
+        printf "\r    %s / %s bytes" "$offset" "$size"
+    done
+    echo ""
+
+    reply=$(curl -s -X POST "$SERVER_URL/upload/finish?id=$upload_id")
+    if [ -n "$(json_field "$reply" "stored")" ]; then
+        echo "✅ Stored as $(json_field "$reply" "stored") (MD5 verified)"
+        return 0
+    fi
+    echo "⚠️  Server rejected upload: $reply"
+    return 1
+}
+
+echo "Uploading $FILE to Mac Server ($SERVER_URL)..."
 if command -v curl >/dev/null 2>&1; then
-    curl -X POST -F "file=@$FILE" http://192.168.1.61:8000/
+    chunked_upload
+    case $? in
+        0) ;;
+        2)
+            echo "[*] Server has no resumable uploads. Falling back to single-request upload..."
+            curl -X POST -F "file=@$FILE" "$SERVER_URL/"
+            ;;
+        *) exit 1 ;;
+    esac
 elif command -v wget >/dev/null 2>&1; then
     # Force octet-stream to avoid server trying to parse as form-urlencoded
-    wget --quiet --header="Content-Type: application/octet-stream" --post-file="$FILE" http://192.168.1.61:8000/ -O /dev/null
+    wget --quiet --header="Content-Type: application/octet-stream" --post-file="$FILE" "$SERVER_URL/" -O /dev/null
 fi
@@ -5,6 +5,12 @@ import subprocess
 import json
 import socket
 import hashlib
+import io
+import tarfile
+import threading
+import http.client
+import http.server
+import urllib.parse
 
 # PC Rescue Station: Unified Python Agent (v1.6.1)
 # FEATURES: Verbose Loop Logging, Self-Updating, Checksum-Sync, Smart Polling, Pulse Protocol
@@ -13,20 +19,220 @@ VERSION = "1.6.1"
 MAC_IPS = ["192.168.1.61", "192.168.1.244", "192.168.1.8", "100.87.229.122"]
 PORT = 8000
 SIGNAL_FILE = ".trigger_sync"
+PULSE_PORT = 8001        # Mac -> PC pulses, served by the agent itself
+PULSE_LOCAL_PORT = 8002  # loopback UDP wake-up from handshake_server.py when it holds PULSE_PORT
 
 # Timing settings (seconds)
 PROFILER_INTERVAL = 3600  
 HEARTBEAT_MIN = 30        
 HEARTBEAT_MAX = 300       
 
-def interruptible_sleep(seconds):
-    """Sleeps but checks for .trigger_sync every second."""
-    for _ in range(int(seconds)):
-        if os.path.exists(SIGNAL_FILE):
-            print("[*] Pulse signal detected! Interrupting sleep...")
-            os.remove(SIGNAL_FILE)
-            return True
-        time.sleep(1)
+# Resumable evidence uploads
+UPLOAD_CHUNK = 1024 * 1024
+UPLOAD_RETRIES = 10
+
+# Batched status shipping: flush on whichever comes first
+STATUS_BATCH_LINES = 20
+STATUS_BATCH_BYTES = 16 * 1024
+STATUS_BATCH_AGE = 5        # seconds a line may wait in the buffer
+STATUS_BUFFER_MAX = 500     # lines kept while the server is unreachable
+
+class HTTPError(Exception):
+    """Non-2xx/304 reply from the Mac server."""
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.body = body
+
+class ServerConnection:
+    """
+    Keep-alive HTTP client for one Mac server. Idle connections are pooled and reused,
+    so a cycle costs one TCP handshake instead of one curl process and handshake per call.
+    """
+
+    MAX_IDLE = 2  # main loop + long-poll thread
+
+    def __init__(self, server_url):
+        parsed = urllib.parse.urlsplit(server_url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _acquire(self, timeout):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            return http.client.HTTPConnection(self.host, self.port, timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.MAX_IDLE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, body=None, headers=None, timeout=30, output=None):
+        """
+        Sends one request and returns (status, headers, body). With output (a binary file)
+        the body is streamed there instead of being returned. Raises HTTPError on errors.
+        """
+        for attempt in range(2):
+            conn, reused = self._acquire(timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                if output is not None and resp.status == 200:
+                    for chunk in iter(lambda: resp.read(65536), b""):
+                        output.write(chunk)
+                    data = b""
+                else:
+                    data = resp.read()
+            except (ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if reused and attempt == 0:
+                    # The server closed an idle keep-alive connection: retry once on a fresh one
+                    if hasattr(body, "seek"):
+                        body.seek(0)
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if resp.status >= 400:
+                raise HTTPError(resp.status, data)
+            return resp.status, resp.headers, data
+
+_connections = {}
+
+def http_request(server_url, method, path, **kwargs):
+    """Routes a request through the pooled keep-alive connection for server_url."""
+    conn = _connections.get(server_url)
+    if conn is None:
+        conn = _connections[server_url] = ServerConnection(server_url)
+    return conn.request(method, path, **kwargs)
+
+# Set by pulses and the instruction long-poll; a sleeping agent blocks on it without polling
+_wake = threading.Event()
+_wake_state = {"reason": ""}
+
+def wake(reason):
+    """Ends the current (or next) interruptible_sleep at once."""
+    _wake_state["reason"] = reason
+    _wake.set()
+
+class PulseHandler(http.server.BaseHTTPRequestHandler):
+    """The Pulse Protocol listener (same routes as handshake_server.py), running inside the agent."""
+
+    def do_GET(self):
+        if self.path == '/ping' or self.path == '/trigger':
+            print(f"[*] Handshake: {self.path} received from Mac!")
+            wake("Pulse signal detected")
+            self._reply(b"OK")
+        elif self.path == '/confirm':
+            print("[*] Handshake: User confirmed execution in browser.")
+            with open(".confirmed", "w") as f:
+                f.write("1")
+            self._reply(b"CONFIRMED")
+        else:
+            self.send_error(404)
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_pulse_listener():
+    """
+    Serves PULSE_PORT from a background thread. If handshake_server.py already holds the port,
+    listens for its loopback UDP wake-ups instead.
+    """
+    try:
+        httpd = http.server.ThreadingHTTPServer(('', PULSE_PORT), PulseHandler)
+    except OSError:
+        try:
+            relay = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            relay.bind(('127.0.0.1', PULSE_LOCAL_PORT))
+        except OSError as e:
+            print(f"⚠️  Pulse listener unavailable: {e}")
+            return
+
+        def relay_loop():
+            while True:
+                relay.recv(64)
+                # handshake_server.py also left its signal file for the bash loop; consume it
+                try:
+                    os.remove(SIGNAL_FILE)
+                except OSError:
+                    pass
+                wake("Pulse signal detected")
+
+        print(f"[*] Port {PULSE_PORT} held by handshake server; relaying pulses via UDP {PULSE_LOCAL_PORT}")
+        threading.Thread(target=relay_loop, daemon=True).start()
+        return
+    print(f"[*] Pulse listener active on port {PULSE_PORT}")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+# At most one /instructions/wait per agent: a sleep cut short by a pulse leaves its poll running,
+# and the next sleep extends that poll instead of opening another server slot
+_poll_lock = threading.Lock()
+_poll_state = {"thread": None, "until": 0.0, "since": ""}
+LONG_POLL_BUSY_BACKOFF = 30  # seconds to wait when the server has no long-poll slot free
+
+def wait_for_instructions(server_url):
+    """Long-polls until the current sleep's deadline and wakes the agent when instructions.sh changes."""
+    while True:
+        with _poll_lock:
+            remaining = _poll_state["until"] - time.time()
+            since_hash = _poll_state["since"]
+            if remaining < 1:
+                _poll_state["thread"] = None
+                return
+        path = f"/instructions/wait?since={since_hash}&timeout={int(remaining)}"
+        try:
+            status, _, _ = http_request(server_url, "GET", path, timeout=int(remaining) + 10)
+            if status == 200:
+                with _poll_lock:
+                    _poll_state["thread"] = None
+                wake("New instructions published")
+                return
+        except HTTPError as e:
+            # 503: every long-poll slot is taken; the heartbeat still runs
+            time.sleep(min(LONG_POLL_BUSY_BACKOFF if e.status == 503 else 5, remaining))
+        except Exception:
+            time.sleep(min(5, remaining))
+
+def interruptible_sleep(seconds, server_url=None, since_hash=""):
+    """Blocks until seconds pass, a pulse arrives or new instructions are published."""
+    # A signal file can still be left by an older handshake_server.py
+    if os.path.exists(SIGNAL_FILE):
+        os.remove(SIGNAL_FILE)
+        wake("Pulse signal detected")
+    if server_url:
+        with _poll_lock:
+            _poll_state["until"] = time.time() + seconds
+            _poll_state["since"] = since_hash
+            if _poll_state["thread"] is None:
+                _poll_state["thread"] = threading.Thread(target=wait_for_instructions, args=(server_url,), daemon=True)
+                _poll_state["thread"].start()
+
+    if _wake.wait(seconds):
+        _wake.clear()
+        print(f"[*] {_wake_state['reason']}! Interrupting sleep...")
+        return True
     return False
 
 def get_file_hash(filepath):
@@ -39,12 +245,136 @@ def get_file_hash(filepath):
             hasher.update(chunk)
     return hasher.hexdigest()
 
-def log_status(msg, mac_url):
+class StatusBuffer:
+    """
+    Collects [AGENT] status lines and ships them to /status/batch in one POST.
+    Flushes when the batch is large or old enough, or at once for urgent lines;
+    lines are kept for the next attempt while the server is unreachable.
+    The age flush is a timer armed by the first buffered line, so an idle agent has no thread waking up.
+    """
+
+    def __init__(self):
+        self._lines = []
+        self._bytes = 0
+        self._timer = None
+        self._url = None
+        self._batch_supported = True
+        self._lock = threading.Lock()      # guards the buffer
+        self._send_lock = threading.Lock()  # keeps batches in order
+
+    def _arm(self):
+        """Schedules the age flush if none is pending. Callers hold _lock."""
+        if self._timer is None:
+            self._timer = threading.Timer(STATUS_BATCH_AGE, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add(self, text, server_url, urgent=False):
+        with self._lock:
+            # Monotonic time of buffering: the server stamps the line with its own clock minus the age
+            self._lines.append({"t": time.monotonic(), "text": text})
+            self._bytes += len(text)
+            self._url = server_url
+            self._arm()
+            full = len(self._lines) >= STATUS_BATCH_LINES or self._bytes >= STATUS_BATCH_BYTES
+        if urgent or full:
+            self.flush()
+
+    def flush(self):
+        """Sends everything buffered. Returns False if it stays queued for a later attempt."""
+        with self._send_lock:
+            with self._lock:
+                lines, server_url = self._lines, self._url
+                self._lines, self._bytes = [], 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not lines:
+                return True
+            try:
+                self._send(lines, server_url)
+                return True
+            except Exception:
+                with self._lock:
+                    # Requeue ahead of newer lines, dropping the oldest beyond the cap
+                    self._lines = (lines + self._lines)[-STATUS_BUFFER_MAX:]
+                    self._bytes = sum(len(line["text"]) for line in self._lines)
+                    self._arm()
+                return False
+
+    def _send(self, lines, server_url):
+        if self._batch_supported:
+            try:
+                now = time.monotonic()
+                batch = [{"age": round(now - line["t"], 1), "text": line["text"]} for line in lines]
+                http_request(server_url, "POST", "/status/batch", body=json.dumps({"lines": batch}),
+                             headers={"Content-Type": "application/json"}, timeout=10)
+                return
+            except HTTPError as e:
+                if e.status not in (404, 501):
+                    raise
+                self._batch_supported = False  # older server: one form POST per line
+        for line in lines:
+            http_request(server_url, "POST", "/", body=urllib.parse.urlencode({"content": line["text"]}),
+                         headers={"Content-Type": "application/x-www-form-urlencoded"}, timeout=10)
+
+_status_buffer = StatusBuffer()
+
+def log_status(msg, mac_url, urgent=False):
+    """Queues an [AGENT] status line; urgent lines (and full batches) are sent immediately."""
     print(f"[*] {msg}")
+    _status_buffer.add(f"[AGENT] {msg}", mac_url, urgent)
+
+def push_evidence(filepath, server_url):
+    """Upload a file with the resumable chunked protocol, resuming from the server's offset after failures."""
+    size = os.path.getsize(filepath)
+    query = urllib.parse.urlencode({"filename": os.path.basename(filepath), "size": size, "md5": get_file_hash(filepath)})
     try:
-        subprocess.run(["curl", "-s", "-d", f"content=[AGENT] {msg}", f"{mac_url}/"], capture_output=True)
-    except:
-        pass
+        _, _, body = http_request(server_url, "POST", f"/upload/start?{query}")
+        session = json.loads(body)
+        upload_id, offset = session["upload_id"], session["offset"]
+    except HTTPError as e:
+        # Older servers answer the empty POST with 400 ("Empty request"), 404 or 501
+        if e.status not in (400, 404, 501):
+            return False
+        # Older server: single multipart POST (rare, so curl builds the form)
+        return subprocess.run(["curl", "-s", "-f", "-F", f"file=@{filepath}", f"{server_url}/"], capture_output=True).returncode == 0
+    except (OSError, http.client.HTTPException, ValueError, KeyError):
+        # Unreachable or a bad reply: the session resumes on the next cycle
+        return False
+
+    failures = 0
+    with open(filepath, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            # Logs may still be growing: never send past the size declared at start
+            chunk = f.read(min(UPLOAD_CHUNK, size - offset))
+            try:
+                _, _, body = http_request(server_url, "POST", f"/upload/chunk?id={upload_id}&offset={offset}", body=chunk,
+                                          headers={"Content-Type": "application/octet-stream"}, timeout=60)
+                offset = json.loads(body)["offset"]
+                failures = 0
+                continue
+            except (OSError, http.client.HTTPException, ValueError, KeyError):
+                pass
+
+            failures += 1
+            if failures > UPLOAD_RETRIES:
+                print(f"⚠️  Upload of {filepath} interrupted at byte {offset}; will resume next time.")
+                return False
+            time.sleep(failures)
+            # Ask the server how much it actually received
+            try:
+                _, _, body = http_request(server_url, "GET", f"/upload/status?id={upload_id}")
+                offset = json.loads(body)["offset"]
+            except Exception:
+                pass
+
+    try:
+        _, _, body = http_request(server_url, "POST", f"/upload/finish?id={upload_id}")
+        return "stored" in json.loads(body)
+    except Exception:
+        return False
 
 def find_server():
     for ip in MAC_IPS:
@@ -59,44 +389,106 @@ def find_server():
             continue
     return None
 
+# Last manifest seen and its ETag (server answers 304 when unchanged)
+_manifest_cache = {"etag": "", "manifest": {}}
+
+def fetch_manifest(server_url):
+    """Fetch the Smart Sync manifest, reusing the cached copy when the server replies 304."""
+    headers = {}
+    if _manifest_cache["etag"] and _manifest_cache["manifest"]:
+        headers["If-None-Match"] = _manifest_cache["etag"]
+    status, resp_headers, body = http_request(server_url, "GET", "/manifest/", headers=headers)
+
+    if status == 304:
+        return _manifest_cache["manifest"]
+
+    manifest = json.loads(body)
+    _manifest_cache["etag"] = resp_headers.get("ETag", "")
+    _manifest_cache["manifest"] = manifest
+    return manifest
+
+def download_script(server_url, remote_path, remote_hash):
+    """Fetches one script to a .tmp file and moves it into place if its hash matches."""
+    local_filename = os.path.basename(remote_path)
+    tmp_file = local_filename + ".tmp"
+    try:
+        with open(tmp_file, "wb") as out:
+            http_request(server_url, "GET", "/" + urllib.parse.quote(remote_path), output=out, timeout=60)
+    except (OSError, http.client.HTTPException, HTTPError) as e:
+        print(f"⚠️  Download of {local_filename} failed: {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+
+    if get_file_hash(tmp_file) != remote_hash:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+    os.chmod(tmp_file, 0o755)
+    os.replace(tmp_file, local_filename)
+    return True
+
+def apply_bundle(data):
+    """
+    Unpacks a /bundle archive all-or-nothing: every script is staged as .tmp and verified
+    against the bundle index before any is replaced. Returns the updated local filenames.
+    """
+    staged = []
+    try:
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+            index = json.load(tar.extractfile(".bundle.json"))["files"]
+            for remote_path, remote_hash in index.items():
+                content = tar.extractfile(remote_path).read()
+                if hashlib.md5(content).hexdigest() != remote_hash:
+                    raise ValueError(f"{remote_path}: checksum mismatch")
+                # Scripts live flat next to the agent, as with single-file sync
+                local_filename = os.path.basename(remote_path)
+                with open(local_filename + ".tmp", "wb") as out:
+                    out.write(content)
+                os.chmod(local_filename + ".tmp", 0o755)
+                staged.append(local_filename)
+    except Exception:
+        for local_filename in staged:
+            os.remove(local_filename + ".tmp")
+        raise
+
+    # The agent goes last: replacing it is followed by a restart
+    staged.sort(key=lambda name: name == "rescue_agent.py")
+    for local_filename in staged:
+        os.replace(local_filename + ".tmp", local_filename)
+    return staged
+
 def sync_files(server_url):
-    """Check manifest and download updated scripts based on checksums."""
+    """Check manifest and fetch every changed script in one /bundle request."""
     try:
-        manifest_raw = subprocess.check_output(["curl", "-s", f"{server_url}/manifest/"]).decode()
-        manifest = json.loads(manifest_raw)
-        files = manifest.get("files", {})
-        
-        updated_any = False
-        
-        for remote_path, info in files.items():
-            if not remote_path.startswith("scripts/"):
-                continue
-                
-            local_filename = os.path.basename(remote_path)
-            remote_hash = info.get("hash")
-            local_hash = get_file_hash(local_filename)
-            
-            if remote_hash != local_hash:
-                print(f"[*] Syncing {local_filename} (Hash mismatch)...")
-                tmp_file = local_filename + ".tmp"
-                subprocess.run(["curl", "-s", "-o", tmp_file, f"{server_url}/{remote_path}"])
-                
-                if get_file_hash(tmp_file) == remote_hash:
-                    if local_filename == "rescue_agent.py":
-                        print("🚀 SELF-UPDATE DETECTED. Restarting agent...")
-                        log_status("Self-updating to newer agent version", server_url)
-                        os.rename(tmp_file, local_filename)
-                        os.chmod(local_filename, 0o755)
-                        os.execv(sys.executable, ['python3'] + sys.argv)
-                    
-                    os.rename(tmp_file, local_filename)
-                    os.chmod(local_filename, 0o755)
-                    log_status(f"Synced script: {local_filename}", server_url)
-                    updated_any = True
-                else:
-                    os.remove(tmp_file)
-        
-        return updated_any
+        manifest = fetch_manifest(server_url)
+        remote = {path: info.get("hash") for path, info in manifest.get("files", {}).items()
+                  if path.startswith("scripts/")}
+        have = {path: get_file_hash(os.path.basename(path)) for path in remote}
+        changed = [path for path, remote_hash in remote.items() if have[path] != remote_hash]
+        if not changed:
+            return False
+
+        print(f"[*] Syncing {len(changed)} script(s) (Hash mismatch)...")
+        try:
+            status, _, body = http_request(server_url, "POST", "/bundle", body=json.dumps({"have": have}),
+                                           headers={"Content-Type": "application/json"}, timeout=120)
+            updated = apply_bundle(body) if status == 200 else []
+        except HTTPError as e:
+            if e.status not in (404, 501):
+                raise
+            # Older server: one request per file
+            updated = [os.path.basename(path) for path in changed if download_script(server_url, path, remote[path])]
+
+        updated.sort(key=lambda name: name == "rescue_agent.py")
+        for local_filename in updated:
+            if local_filename == "rescue_agent.py":
+                print("🚀 SELF-UPDATE DETECTED. Restarting agent...")
+                log_status("Self-updating to newer agent version", server_url, urgent=True)
+                os.execv(sys.executable, ['python3'] + sys.argv)
+            log_status(f"Synced script: {local_filename}", server_url)
+
+        return bool(updated)
     except Exception as e:
         print(f"⚠️  Sync failed: {e}")
         return False
@@ -116,7 +508,8 @@ def main():
     except:
         pass
 
-    log_status(f"Agent v{VERSION} online", server_url)
+    start_pulse_listener()
+    log_status(f"Agent v{VERSION} online", server_url, urgent=True)
 
     last_profile_time = 0
     last_instr_hash = ""
@@ -135,14 +528,13 @@ def main():
             
             # 2. Instruction Phase
             print("[2/3] Checking for injected instructions...")
-            manifest_raw = subprocess.check_output(["curl", "-s", f"{server_url}/manifest/"]).decode()
-            manifest = json.loads(manifest_raw)
+            manifest = fetch_manifest(server_url)
             file_info = manifest.get("files", {}).get("scripts/instructions.sh", {})
             current_hash = file_info.get("hash", "")
             
             if current_hash and current_hash != last_instr_hash:
                 print(f"🔥 FIRE: New instructions detected (Hash: {current_hash[:8]})")
-                log_status(f"Executing injected instruction (Hash: {current_hash[:8]})", server_url)
+                log_status(f"Executing injected instruction (Hash: {current_hash[:8]})", server_url, urgent=True)
                 
                 if os.path.exists("render_output.py"):
                     subprocess.run(f"python3 render_output.py result_template.html instructions.sh 'Latest' 'PENDING' > res.html", shell=True)
@@ -151,16 +543,19 @@ def main():
                     else:
                         subprocess.run("xdg-open res.html &", shell=True)
                 
-                subprocess.run(f"./instructions.sh {server_ip}", shell=True)
+                subprocess.run(f"./instructions.sh {server_ip} 2>&1 | tee instructions.log", shell=True)
+                if push_evidence("instructions.log", server_url):
+                    log_status("Instruction output uploaded (instructions.log)", server_url)
                 last_instr_hash = current_hash
             else:
                 print("   (No new instructions)")
             
             # 3. Heartbeat Phase
             print(f"[3/3] Sending heartbeat. Sleeping for {int(heartbeat_delay)}s...")
-            log_status(f"Cycle complete. Passive for {int(heartbeat_delay)}s.", server_url)
+            # End of cycle: ship everything buffered before going passive
+            log_status(f"Cycle complete. Passive for {int(heartbeat_delay)}s.", server_url, urgent=True)
             
-            interrupted = interruptible_sleep(heartbeat_delay)
+            interrupted = interruptible_sleep(heartbeat_delay, server_url, last_instr_hash)
             if interrupted:
                 heartbeat_delay = HEARTBEAT_MIN
             else:
@@ -168,6 +563,7 @@ def main():
             
         except KeyboardInterrupt:
             print("\n👋 Agent stopping.")
+            _status_buffer.flush()
             break
         except Exception as e:
             print(f"⚠️  Error: {e}")
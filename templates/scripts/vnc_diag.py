@@ -1,6 +1,7 @@
 import socket
 import struct
 import sys
+import time
 
 def test_vnc_handshake(host, port=5900):
     print(f"[*] Connecting to {host}:{port}...")
@@ -64,54 +65,178 @@ def test_vnc_handshake(host, port=5900):
     finally:
         s.close()
 
+VNC_PORTS = range(5900, 5906)
+CONNECT_TIMEOUT = 2
+HANDSHAKE_TIMEOUT = 5
+HOST_DEADLINE = 8      # seconds a whole host may take, all ports included
+MAX_WORKERS = 32
+
+def _recv_exact(s, count):
+    data = b""
+    while len(data) < count:
+        chunk = s.recv(count - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def probe_port(host, port, deadline):
+    """Connects to one port and walks the RFB handshake up to ServerInit. Returns a result dict."""
+    result = {"port": port, "open": False, "status": "CLOSED"}
+    remaining = lambda: max(0.05, deadline - time.monotonic())
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.settimeout(min(CONNECT_TIMEOUT, remaining()))
+        if s.connect_ex((host, port)) != 0:
+            return result
+        result["open"] = True
+        result["status"] = "OPEN"
+
+        s.settimeout(min(HANDSHAKE_TIMEOUT, remaining()))
+        version = _recv_exact(s, 12)
+        if not version.startswith(b"RFB"):
+            result["status"] = "NOT_VNC"
+            return result
+        result["rfb_version"] = version.decode(errors="replace").strip()
+
+        s.settimeout(min(HANDSHAKE_TIMEOUT, remaining()))
+        s.send(b"RFB 003.003\n")
+        sec_bytes = _recv_exact(s, 4)
+        if len(sec_bytes) < 4:
+            result["status"] = "HANDSHAKE_FAILED"
+            return result
+        sec_val = int.from_bytes(sec_bytes, "big")
+        result["auth"] = sec_val
+        if sec_val == 0:
+            reason_len = int.from_bytes(_recv_exact(s, 4), "big")
+            result["status"] = "REFUSED"
+            result["error"] = _recv_exact(s, reason_len).decode(errors="replace")
+            return result
+
+        # Try to get desktop name via ClientInit/ServerInit
+        name = "Unknown"
+        s.settimeout(min(HANDSHAKE_TIMEOUT, remaining()))
+        s.send(b"\x01")  # ClientInit (Shared)
+        server_init = _recv_exact(s, 24)
+        if len(server_init) >= 24:
+            name_len = int.from_bytes(server_init[20:24], "big")
+            name = _recv_exact(s, name_len).decode(errors="replace")
+        result["name"] = name
+        result["status"] = "UP"
+    except (OSError, ValueError) as e:
+        result["error"] = str(e) or e.__class__.__name__
+    finally:
+        s.close()
+    return result
+
+def _summarise(host, port_results, started, finished):
+    port_results.sort(key=lambda r: r["port"])
+    up = [r for r in port_results if r["status"] == "UP"]
+    summary = {
+        "host": host,
+        "status": "RUNNING" if up else "STOPPED",
+        "port": up[0]["port"] if up else None,
+        "detail": f"UP (Auth:{up[0]['auth']}, Name:{up[0]['name']})" if up else "No VNC server found",
+        "ports": port_results,
+        "elapsed": round(finished - started, 3),
+    }
+    return summary
+
+def scan_hosts(hosts, ports=VNC_PORTS, host_deadline=HOST_DEADLINE, max_workers=MAX_WORKERS):
+    """
+    Probes every (host, port) pair concurrently. Returns one summary dict per host, in input order.
+    Each host's deadline starts when its first probe does, so hosts queued behind a full pool
+    still get their whole budget.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor, wait
+    hosts = list(dict.fromkeys(hosts))
+    lock = threading.Lock()
+    started, deadlines, finished = {}, {}, {}
+    pending = {}
+
+    def timed_probe(host, port):
+        with lock:
+            if host not in deadlines:
+                started[host] = time.monotonic()
+                deadlines[host] = started[host] + host_deadline
+        result = probe_port(host, port, deadlines[host])
+        with lock:
+            finished[host] = max(finished.get(host, 0), time.monotonic())
+        return result
+
+    workers = max(1, min(max_workers, len(hosts) * len(ports)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for host in hosts:
+            for port in ports:
+                pending[pool.submit(timed_probe, host, port)] = (host, port)
+        # Socket timeouts already honour each host's deadline; the wait is a safety net
+        waves = -(-len(pending) // workers)
+        done, not_done = wait(pending, timeout=waves * host_deadline + 1)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    now = time.monotonic()
+    by_host = {host: [] for host in hosts}
+    for future, (host, port) in pending.items():
+        if future in done and future.exception() is None:
+            by_host[host].append(future.result())
+        else:
+            by_host[host].append({"port": port, "open": False, "status": "TIMEOUT"})
+            finished[host] = now
+    return [_summarise(host, by_host[host], started.get(host, now), finished.get(host, now)) for host in hosts]
+
 def probe_vnc(host):
+    """Probes 5900-5905 on one host in parallel and prints the legacy RESULT line."""
     print(f"[*] Probing {host} for VNC (5900-5905)...")
-    results = []
-    for port in range(5900, 5906):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(2)
-            res = s.connect_ex((host, port))
-            if res == 0:
-                print(f"[+] Found open port: {port}")
-                # Try handshake
-                s.settimeout(5)
-                version = s.recv(12)
-                if version.startswith(b"RFB"):
-                    s.send(b"RFB 003.003\n")
-                    sec_bytes = s.recv(4)
-                    if not sec_bytes:
-                        results.append((port, "Handshake failed"))
-                        continue
-                    sec_val = int.from_bytes(sec_bytes, "big")
-                    
-                    # Try to get desktop name via ClientInit/ServerInit
-                    s.send(b"\x01") # ClientInit (Shared)
-                    server_init = s.recv(24)
-                    name = "Unknown"
-                    if len(server_init) >= 24:
-                        name_len = int.from_bytes(server_init[20:24], "big")
-                        name = s.recv(name_len).decode()
-                    
-                    results.append((port, f"UP (Auth:{sec_val}, Name:{name})"))
-            s.close()
-        except:
-            pass
-    
-    if results:
-        best_port, status = results[0]
-        print(f"RESULT: {best_port} | {status}")
-        return best_port, status
-    else:
-        print("RESULT: FAIL")
-        return None, "No VNC server found"
+    summary = scan_hosts([host])[0]
+    for r in summary["ports"]:
+        if r["open"]:
+            print(f"[+] Found open port: {r['port']} ({r['status']})")
+    if summary["port"] is not None:
+        print(f"RESULT: {summary['port']} | {summary['detail']}")
+        return summary["port"], summary["detail"]
+    print("RESULT: FAIL")
+    return None, summary["detail"]
+
+def known_clients(root="."):
+    """Client IPs the Mac server has seen: one audit_logs/<ip>/ directory each."""
+    import os
+    audit_dir = os.path.join(root, "audit_logs")
+    try:
+        names = sorted(os.listdir(audit_dir))
+    except OSError:
+        return []
+    return [n for n in names if os.path.isdir(os.path.join(audit_dir, n)) and not n.startswith(".")]
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 vnc_diag.py <IP_ADDRESS> [PORT]")
+    # Legacy forms: vnc_diag.py <IP> (probe) and vnc_diag.py <IP> <PORT> (verbose handshake)
+    if len(sys.argv) == 3 and sys.argv[2].isdigit():
+        test_vnc_handshake(sys.argv[1], int(sys.argv[2]))
+        sys.exit(0)
+
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Parallel VNC (RFB) probe for 5900-5905")
+    parser.add_argument("hosts", nargs="*", help="IP addresses or hostnames to probe")
+    parser.add_argument("--all", action="store_true",
+                        help="Also scan every client in audit_logs/ (run from the rescue-site directory)")
+    parser.add_argument("--root", default=".", help="rescue-site directory for --all (default: .)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON document instead of text")
+    parser.add_argument("--deadline", type=float, default=HOST_DEADLINE,
+                        help=f"Seconds allowed per host, all ports included (default: {HOST_DEADLINE})")
+    args = parser.parse_args()
+
+    hosts = args.hosts + (known_clients(args.root) if args.all else [])
+    if not hosts:
+        parser.print_usage()
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps({"results": scan_hosts(hosts, host_deadline=args.deadline)}, indent=2))
+    elif len(hosts) == 1:
+        probe_vnc(hosts[0])
     else:
-        host = sys.argv[1]
-        if len(sys.argv) > 2:
-            test_vnc_handshake(host, int(sys.argv[2]))
-        else:
-            probe_vnc(host)
+        for summary in scan_hosts(hosts, host_deadline=args.deadline):
+            print(f"{summary['host']}: {summary['status']} | {summary['port'] or '-'} | {summary['detail']}")
@@ -0,0 +1,130 @@
+#!/usr/bin/env bash
+# Bridge Test for Activity Log Rotation and Time Windows
+# Goal: Verify that a rotated log is read back by /client_details?from=&to= without losing boundary lines.
+
+TEST_PORT=8006
+TEST_DIR="/tmp/rescue-history-test"
+SERVER_SCRIPT="./server/rescue_server.py"
+SERVER_URL="http://localhost:$TEST_PORT"
+LOG_DIR="$TEST_DIR/audit_logs/127.0.0.1"
+
+fail() {
+    echo "$1"
+    kill "$SERVER_PID" 2>/dev/null
+    exit 1
+}
+
+# Counts the activity_log lines of a /client_details reply stamped with $2
+count_stamped() {
+    echo "$1" | python3 -c "import json, sys; print(sum(l.startswith('[$2]') for l in json.load(sys.stdin)['activity_log']))"
+}
+
+# --- Setup ---
+rm -rf "$TEST_DIR"
+mkdir -p "$TEST_DIR/server" "$LOG_DIR"
+cp "$SERVER_SCRIPT" "$TEST_DIR/server/rescue_server.py"
+
+# ~100-byte lines: 400 stamped A, 600 stamped B, 100 stamped C. The 64 KB gzip member
+# boundary falls inside the B lines, so the second member starts in the same second.
+pad=$(printf '%080d' 0)
+{
+    for i in $(seq 1 400); do echo "[20260101_000000] [AGENT] line $i $pad"; done
+    for i in $(seq 1 600); do echo "[20260101_000001] [AGENT] line $i $pad"; done
+    for i in $(seq 1 100); do echo "[20260101_000002] [AGENT] line $i $pad"; done
+} > "$LOG_DIR/client_activity.log"
+
+# A second PC with more lines than one window may return
+mkdir -p "$TEST_DIR/audit_logs/10.0.0.9"
+for i in $(seq 1 6000); do echo "[20260102_000000] [AGENT] line $i"; done > "$TEST_DIR/audit_logs/10.0.0.9/client_activity.log"
+
+echo "[*] Ensuring port $TEST_PORT is free..."
+lsof -ti :$TEST_PORT | xargs kill -9 > /dev/null 2>&1
+
+echo "[*] Starting test server..."
+(cd "$TEST_DIR" && uv run python server/rescue_server.py "$TEST_PORT") > "$TEST_DIR/server.log" 2>&1 &
+SERVER_PID=$!
+sleep 2
+
+# --- Test Execution ---
+
+# H001: A new bootstrap session rotates the live log into a multi-member history segment
+echo "Testing H001: Rotation..."
+curl -s -X POST -d "content=[BOOTSTRAP] Checking dependencies" "$SERVER_URL/" > /dev/null
+members=$(python3 -c "import json; print(len(json.loads(open('$LOG_DIR/.history/index.jsonl').readline())['blocks']))" 2>/dev/null)
+if [ -n "$members" ] && [ "$members" -gt 1 ]; then
+    echo "H001: PASS"
+else
+    fail "H001: FAIL (Expected a segment with several members, got '$members')"
+fi
+
+# H002: A window starting on the boundary second returns every line of that second
+echo "Testing H002: Boundary second..."
+reply=$(curl -s "$SERVER_URL/client_details?ip=127.0.0.1&from=20260101_000001&to=20260101_000001")
+count=$(count_stamped "$reply" 20260101_000001)
+if [ "$count" == "600" ]; then
+    echo "H002: PASS"
+else
+    fail "H002: FAIL (Got $count of 600 lines)"
+fi
+
+# H003: Open-ended windows include both bounds and the live log
+echo "Testing H003: Open-ended windows..."
+reply=$(curl -s "$SERVER_URL/client_details?ip=127.0.0.1&to=20260101_000000")
+before=$(count_stamped "$reply" 20260101_000000)
+reply=$(curl -s "$SERVER_URL/client_details?ip=127.0.0.1&from=20260101_000002")
+after=$(count_stamped "$reply" 20260101_000002)
+bootstrap=$(echo "$reply" | grep -c "Checking dependencies")
+if [ "$before" == "400" ] && [ "$after" == "100" ] && [ "$bootstrap" == "1" ]; then
+    echo "H003: PASS"
+else
+    fail "H003: FAIL (Got $before/400 before, $after/100 after, bootstrap line: $bootstrap)"
+fi
+
+# H004: A batched line keeps its age-based stamp even after newer lines, and windows find it
+echo "Testing H004: Out-of-order batch stamps..."
+curl -s -X POST -d "content=[AGENT] live line" "$SERVER_URL/" > /dev/null
+curl -s -X POST -H "Content-Type: application/json" \
+    -d '{"lines": [{"age": 3600, "text": "[AGENT] buffered line"}]}' "$SERVER_URL/status/batch" > /dev/null
+from=$(python3 -c "import datetime as d; print((d.datetime.now() - d.timedelta(seconds=3700)).strftime('%Y%m%d_%H%M%S'))")
+to=$(python3 -c "import datetime as d; print((d.datetime.now() - d.timedelta(seconds=3500)).strftime('%Y%m%d_%H%M%S'))")
+reply=$(curl -s "$SERVER_URL/client_details?ip=127.0.0.1&from=$from&to=$to")
+if [[ "$reply" == *"buffered line"* ]] && [[ "$reply" != *"live line"* ]]; then
+    echo "H004: PASS"
+else
+    fail "H004: FAIL (Window $from-$to returned: $reply)"
+fi
+
+# H005: The same window still finds it once the log is rotated into history
+echo "Testing H005: Out-of-order stamps in history..."
+curl -s -X POST -d "content=[BOOTSTRAP] Checking dependencies" "$SERVER_URL/" > /dev/null
+reply=$(curl -s "$SERVER_URL/client_details?ip=127.0.0.1&from=$from&to=$to")
+segments=$(wc -l < "$LOG_DIR/.history/index.jsonl" | tr -d ' ')
+if [ "$segments" == "2" ] && [[ "$reply" == *"buffered line"* ]] && [[ "$reply" != *"live line"* ]]; then
+    echo "H005: PASS"
+else
+    fail "H005: FAIL ($segments segments, window returned: $reply)"
+fi
+
+# H006: A window holding more than 5000 lines is cut at the limit and flagged truncated
+echo "Testing H006: Window limit..."
+reply=$(curl -s "$SERVER_URL/client_details?ip=10.0.0.9&from=20260102_000000")
+result=$(echo "$reply" | python3 -c "import json, sys; d = json.load(sys.stdin); print(len(d['activity_log']), d['truncated'], d['activity_log'][0].strip())")
+if [ "$result" == "5000 True [20260102_000000] [AGENT] line 1" ]; then
+    echo "H006: PASS"
+else
+    fail "H006: FAIL (Got '$result')"
+fi
+
+# H007: Windows outside the log, or with from after to, are empty and not truncated
+echo "Testing H007: Empty windows..."
+for window in "from=20270101_000000" "to=20250101_000000" "from=20260102_000001&to=20260102_000000"; do
+    result=$(curl -s "$SERVER_URL/client_details?ip=10.0.0.9&$window" | \
+        python3 -c "import json, sys; d = json.load(sys.stdin); print(len(d['activity_log']), d['truncated'])")
+    [ "$result" == "0 False" ] || fail "H007: FAIL ($window returned '$result')"
+done
+echo "H007: PASS"
+
+# --- Teardown ---
+kill "$SERVER_PID"
+rm -rf "$TEST_DIR"
+echo "Activity History Bridge Test Passed."
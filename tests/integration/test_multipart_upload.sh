@@ -0,0 +1,110 @@
+#!/usr/bin/env bash
+# Bridge Test for Streamed Multipart Uploads
+# Goal: Verify that the streaming multipart parser stores every file intact, whatever the chunking.
+
+TEST_PORT=8007
+TEST_DIR="/tmp/rescue-multipart-test"
+SERVER_SCRIPT="./server/rescue_server.py"
+SERVER_URL="http://localhost:$TEST_PORT"
+EVIDENCE_DIR="$TEST_DIR/evidence/127.0.0.1"
+BOUNDARY="RescueTestBoundary42"
+
+file_md5() { md5 -q "$1" 2>/dev/null || md5sum "$1" | awk '{print $1}'; }
+
+fail() {
+    echo "$1"
+    kill "$SERVER_PID" 2>/dev/null
+    exit 1
+}
+
+# Writes a multipart body to $1 holding the files given as name=path pairs, plus one text field
+build_body() {
+    python3 - "$BOUNDARY" "$@" <<'EOF'
+import sys
+boundary, out, pairs = sys.argv[1].encode(), sys.argv[2], sys.argv[3:]
+body = b""
+for pair in pairs:
+    name, path = pair.split("=", 1)
+    body += b"--" + boundary + b"\r\n"
+    body += f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'.encode()
+    body += b"Content-Type: application/octet-stream\r\n\r\n"
+    body += open(path, "rb").read() + b"\r\n"
+body += b"--" + boundary + b'\r\nContent-Disposition: form-data; name="note"\r\n\r\nhello\r\n'
+body += b"--" + boundary + b"--\r\n"
+open(out, "wb").write(body)
+EOF
+}
+
+post_body() {
+    curl -s -o /dev/null -w "%{http_code}" -X POST -H "Content-Type: multipart/form-data; boundary=$BOUNDARY" \
+        --data-binary "@$1" "$SERVER_URL/"
+}
+
+# --- Setup ---
+rm -rf "$TEST_DIR"
+mkdir -p "$TEST_DIR/server" "$TEST_DIR/files"
+cp "$SERVER_SCRIPT" "$TEST_DIR/server/rescue_server.py"
+
+echo "[*] Ensuring port $TEST_PORT is free..."
+lsof -ti :$TEST_PORT | xargs kill -9 > /dev/null 2>&1
+
+echo "[*] Starting test server..."
+(cd "$TEST_DIR" && uv run python server/rescue_server.py "$TEST_PORT") > "$TEST_DIR/server.log" 2>&1 &
+SERVER_PID=$!
+sleep 2
+
+# --- Test Execution ---
+
+# M001: Several files in one form are each stored with their own name and content
+echo "Testing M001: Several files in one request..."
+dd if=/dev/urandom of="$TEST_DIR/files/a.bin" bs=1k count=300 2>/dev/null
+echo "small text file" > "$TEST_DIR/files/b.txt"
+build_body "$TEST_DIR/body.bin" "a.bin=$TEST_DIR/files/a.bin" "b.txt=$TEST_DIR/files/b.txt"
+status=$(post_body "$TEST_DIR/body.bin")
+stored_a=$(ls "$EVIDENCE_DIR" | grep "_a.bin$")
+stored_b=$(ls "$EVIDENCE_DIR" | grep "_b.txt$")
+if [ "$status" == "201" ] && [ "$(file_md5 "$EVIDENCE_DIR/$stored_a")" == "$(file_md5 "$TEST_DIR/files/a.bin")" ] \
+    && [ "$(file_md5 "$EVIDENCE_DIR/$stored_b")" == "$(file_md5 "$TEST_DIR/files/b.txt")" ]; then
+    echo "M001: PASS"
+else
+    fail "M001: FAIL (Status $status, stored: $stored_a $stored_b)"
+fi
+
+# M002: Delimiters split across the parser's 64 KB reads, and content that almost matches one
+echo "Testing M002: Split boundaries..."
+for shift in -30 -23 -12 -1 0 1 12 30; do
+    # The first delimiter after the file starts at body offset 65536 + shift
+    python3 - "$TEST_DIR/files/split.bin" "$shift" "$BOUNDARY" <<'EOF'
+import sys
+path, shift, boundary = sys.argv[1], int(sys.argv[2]), sys.argv[3].encode()
+header = b'--' + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="split.bin"\r\nContent-Type: application/octet-stream\r\n\r\n'
+# Near-misses of the delimiter inside the content must stay content
+filler = b"\r\n--" + boundary[:-1] + b"X\r\n-" + b"-" + boundary[:5]
+size = 65536 + shift - len(header)
+open(path, "wb").write((filler * (size // len(filler) + 1))[:size])
+EOF
+    rm -f "$EVIDENCE_DIR"/*_split.bin
+    build_body "$TEST_DIR/body.bin" "split.bin=$TEST_DIR/files/split.bin"
+    status=$(post_body "$TEST_DIR/body.bin")
+    stored=$(ls "$EVIDENCE_DIR" | grep "_split.bin$" | tail -1)
+    if [ "$status" != "201" ] || [ "$(file_md5 "$EVIDENCE_DIR/$stored")" != "$(file_md5 "$TEST_DIR/files/split.bin")" ]; then
+        fail "M002: FAIL (Delimiter at 65536$shift: status $status)"
+    fi
+done
+echo "M002: PASS"
+
+# M003: A body cut off before its closing delimiter is rejected and leaves no partial file
+echo "Testing M003: Truncated body..."
+build_body "$TEST_DIR/body.bin" "cut.bin=$TEST_DIR/files/a.bin"
+head -c 200000 "$TEST_DIR/body.bin" > "$TEST_DIR/cut.bin"
+status=$(post_body "$TEST_DIR/cut.bin")
+if [ "$status" == "400" ] && ! ls "$EVIDENCE_DIR" | grep -q "_cut.bin$"; then
+    echo "M003: PASS"
+else
+    fail "M003: FAIL (Status $status)"
+fi
+
+# --- Teardown ---
+kill "$SERVER_PID"
+rm -rf "$TEST_DIR"
+echo "Multipart Upload Bridge Test Passed."
@@ -0,0 +1,97 @@
+#!/usr/bin/env bash
+# Bridge Test for the Paste Log
+# Goal: Verify that pastes kept in evidence/<ip>/.pastes/ are served under their old evidence URLs.
+
+TEST_PORT=8009
+TEST_DIR="/tmp/rescue-pastelog-test"
+SERVER_SCRIPT="./server/rescue_server.py"
+SERVER_URL="http://localhost:$TEST_PORT"
+EVIDENCE_DIR="$TEST_DIR/evidence/127.0.0.1"
+
+fail() {
+    echo "$1"
+    kill "$SERVER_PID" 2>/dev/null
+    exit 1
+}
+
+start_server() {
+    (cd "$TEST_DIR" && uv run python server/rescue_server.py "$TEST_PORT") >> "$TEST_DIR/server.log" 2>&1 &
+    SERVER_PID=$!
+    sleep 2
+}
+
+# Posts a paste (form-encoded from file $1) and prints the name it was stored under
+post_paste() {
+    curl -s -X POST --data-urlencode "content@$1" "$SERVER_URL/" | grep -o '[0-9_.]*_paste\.txt' | head -1
+}
+
+# --- Setup ---
+rm -rf "$TEST_DIR"
+mkdir -p "$TEST_DIR/server" "$EVIDENCE_DIR"
+cp "$SERVER_SCRIPT" "$TEST_DIR/server/rescue_server.py"
+# A paste file written by an older server
+echo "legacy paste" > "$EVIDENCE_DIR/20250101_000000_paste.txt"
+
+echo "[*] Ensuring port $TEST_PORT is free..."
+lsof -ti :$TEST_PORT | xargs kill -9 > /dev/null 2>&1
+
+echo "[*] Starting test server..."
+start_server
+
+# --- Test Execution ---
+
+# L001: Legacy paste files are moved into the log at startup and still served
+echo "Testing L001: Legacy compaction..."
+body=$(curl -s "$SERVER_URL/evidence/127.0.0.1/20250101_000000_paste.txt")
+if [ "$body" == "legacy paste" ] && [ ! -f "$EVIDENCE_DIR/20250101_000000_paste.txt" ]; then
+    echo "L001: PASS"
+else
+    fail "L001: FAIL (Got '$body')"
+fi
+
+# L002: Pastes posted in the same second get distinct names and come back byte for byte
+echo "Testing L002: Round trip..."
+printf 'first paste\nwith two lines ✓' > "$TEST_DIR/p1.txt"
+printf 'second paste' > "$TEST_DIR/p2.txt"
+name1=$(post_paste "$TEST_DIR/p1.txt")
+name2=$(post_paste "$TEST_DIR/p2.txt")
+curl -s -o "$TEST_DIR/got1.txt" "$SERVER_URL/evidence/127.0.0.1/$name1"
+curl -s -o "$TEST_DIR/got2.txt" "$SERVER_URL/evidence/127.0.0.1/$name2"
+if [ -n "$name1" ] && [ "$name1" != "$name2" ] && cmp -s "$TEST_DIR/p1.txt" "$TEST_DIR/got1.txt" \
+    && cmp -s "$TEST_DIR/p2.txt" "$TEST_DIR/got2.txt" && ! ls "$EVIDENCE_DIR" | grep -q "_paste.txt$"; then
+    echo "L002: PASS"
+else
+    fail "L002: FAIL (Names '$name1' '$name2')"
+fi
+
+# L003: A full segment rolls over to the next one; pastes on both sides stay readable
+echo "Testing L003: Segment rollover..."
+head -c 9000000 /dev/zero | tr '\0' 'a' > "$TEST_DIR/big.txt"
+big=$(post_paste "$TEST_DIR/big.txt")
+after=$(post_paste "$TEST_DIR/p2.txt")
+curl -s -o "$TEST_DIR/got_big.txt" "$SERVER_URL/evidence/127.0.0.1/$big"
+if [ -f "$EVIDENCE_DIR/.pastes/seg_000002.log" ] && cmp -s "$TEST_DIR/big.txt" "$TEST_DIR/got_big.txt" \
+    && [ "$(curl -s "$SERVER_URL/evidence/127.0.0.1/$after")" == "second paste" ]; then
+    echo "L003: PASS"
+else
+    fail "L003: FAIL (Big paste '$big', next '$after')"
+fi
+
+# L004: After a restart the index is reloaded: pastes are listed and served, unknown names are 404
+echo "Testing L004: Restart..."
+kill "$SERVER_PID"
+sleep 1
+start_server
+listing=$(curl -s "$SERVER_URL/evidence/127.0.0.1/")
+status=$(curl -s -o /dev/null -w "%{http_code}" "$SERVER_URL/evidence/127.0.0.1/20990101_000000_paste.txt")
+if [[ "$listing" == *"$name1"* ]] && [[ "$listing" == *"$after"* ]] && [ "$status" == "404" ] \
+    && cmp -s "$TEST_DIR/p1.txt" <(curl -s "$SERVER_URL/evidence/127.0.0.1/$name1"); then
+    echo "L004: PASS"
+else
+    fail "L004: FAIL (Unknown paste returned $status)"
+fi
+
+# --- Teardown ---
+kill "$SERVER_PID"
+rm -rf "$TEST_DIR"
+echo "Paste Log Bridge Test Passed."
@@ -0,0 +1,101 @@
+#!/usr/bin/env bash
+# Bridge Test for the /proxy Download Cache
+# Goal: Verify miss, hit, stale-while-offline and Range requests against a local origin.
+
+TEST_PORT=8004
+ORIGIN_PORT=8005
+TEST_DIR="/tmp/rescue-proxy-test"
+SERVER_SCRIPT="./server/rescue_server.py"
+SERVER_URL="http://localhost:$TEST_PORT"
+
+# /proxy refuses localhost URLs, so the origin is reached through the machine's own LAN address
+ORIGIN_HOST=$(hostname -I 2>/dev/null | awk '{print $1}')
+[ -z "$ORIGIN_HOST" ] && ORIGIN_HOST=$(ipconfig getifaddr en0 2>/dev/null)
+[ -z "$ORIGIN_HOST" ] && ORIGIN_HOST="127.0.0.2"
+ORIGIN_URL="http://$ORIGIN_HOST:$ORIGIN_PORT/pkg.deb"
+# Nothing listens on port 1: connection refused, i.e. an offline origin
+OFFLINE_URL="http://$ORIGIN_HOST:1/offline.deb"
+
+file_md5() { md5 -q "$1" 2>/dev/null || md5sum "$1" | awk '{print $1}'; }
+
+fail() {
+    echo "$1"
+    kill "$SERVER_PID" "$ORIGIN_PID" 2>/dev/null
+    exit 1
+}
+
+# --- Setup ---
+rm -rf "$TEST_DIR"
+mkdir -p "$TEST_DIR/server" "$TEST_DIR/origin" "$TEST_DIR/downloads_cache"
+cp "$SERVER_SCRIPT" "$TEST_DIR/server/rescue_server.py"
+dd if=/dev/urandom of="$TEST_DIR/origin/pkg.deb" bs=1k count=2000 2>/dev/null
+ORIGIN_HASH=$(file_md5 "$TEST_DIR/origin/pkg.deb")
+
+# Seed a day-old cache entry whose origin is unreachable
+OFFLINE_KEY=$(printf '%s' "$OFFLINE_URL" | (shasum -a 256 2>/dev/null || sha256sum) | awk '{print $1}')
+echo "cached offline copy" > "$TEST_DIR/downloads_cache/$OFFLINE_KEY.bin"
+cat > "$TEST_DIR/downloads_cache/index.json" <<EOF
+{"$OFFLINE_KEY": {"url": "$OFFLINE_URL", "filename": "offline.deb", "size": 20, "etag": "", "last_modified": "", "fetched": 0, "last_access": 0}}
+EOF
+
+echo "[*] Ensuring ports $TEST_PORT and $ORIGIN_PORT are free..."
+lsof -ti :$TEST_PORT | xargs kill -9 > /dev/null 2>&1
+lsof -ti :$ORIGIN_PORT | xargs kill -9 > /dev/null 2>&1
+
+echo "[*] Starting origin and test server..."
+(cd "$TEST_DIR/origin" && python3 -m http.server "$ORIGIN_PORT") > "$TEST_DIR/origin.log" 2>&1 &
+ORIGIN_PID=$!
+(cd "$TEST_DIR" && uv run python server/rescue_server.py "$TEST_PORT") > "$TEST_DIR/server.log" 2>&1 &
+SERVER_PID=$!
+sleep 2
+
+# --- Test Execution ---
+
+# P001: A miss streams the origin file through and stores it
+echo "Testing P001: Cache miss..."
+curl -s -o "$TEST_DIR/miss.deb" "$SERVER_URL/proxy?url=$ORIGIN_URL"
+if [ "$(file_md5 "$TEST_DIR/miss.deb")" == "$ORIGIN_HASH" ]; then
+    echo "P001: PASS"
+else
+    fail "P001: FAIL (Proxied file differs from the origin)"
+fi
+
+# P002: The second request is served from the cache
+echo "Testing P002: Cache hit..."
+sleep 0.5
+curl -s -o "$TEST_DIR/hit.deb" "$SERVER_URL/proxy?url=$ORIGIN_URL"
+if [ "$(file_md5 "$TEST_DIR/hit.deb")" == "$ORIGIN_HASH" ] && grep -q "Cache hit for pkg.deb" "$TEST_DIR/server.log" \
+    && [ "$(grep -c 'GET /pkg.deb' "$TEST_DIR/origin.log")" == "1" ]; then
+    echo "P002: PASS"
+else
+    fail "P002: FAIL (Second request was not a cache hit)"
+fi
+
+# P003: A stale entry is served while the origin is offline, without retrying it on every request
+echo "Testing P003: Stale copy while offline..."
+for i in 1 2 3; do
+    body=$(curl -s -m 5 "$SERVER_URL/proxy?url=$OFFLINE_URL")
+    [ "$body" == "cached offline copy" ] || fail "P003: FAIL (Request $i got '$body')"
+done
+attempts=$(grep -c "Origin unreachable" "$TEST_DIR/server.log")
+if [ "$attempts" == "1" ]; then
+    echo "P003: PASS"
+else
+    fail "P003: FAIL (Origin was retried $attempts times)"
+fi
+
+# P004: Range requests on a cached file get 206 with just the requested bytes
+echo "Testing P004: Range request..."
+status=$(curl -s -r 100-199 -o "$TEST_DIR/range.bin" -w "%{http_code}" "$SERVER_URL/proxy?url=$ORIGIN_URL")
+expected=$(tail -c +101 "$TEST_DIR/origin/pkg.deb" | head -c 100 | od -An -tx1 | tr -d ' \n')
+actual=$(od -An -tx1 "$TEST_DIR/range.bin" | tr -d ' \n')
+if [ "$status" == "206" ] && [ "$expected" == "$actual" ]; then
+    echo "P004: PASS"
+else
+    fail "P004: FAIL (Range returned $status)"
+fi
+
+# --- Teardown ---
+kill "$SERVER_PID" "$ORIGIN_PID"
+rm -rf "$TEST_DIR"
+echo "Proxy Cache Bridge Test Passed."
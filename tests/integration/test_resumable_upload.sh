@@ -0,0 +1,94 @@
+#!/usr/bin/env bash
+# Bridge Test for Resumable Chunked Evidence Uploads
+# Goal: Verify that an interrupted upload resumes from the server's offset and is MD5-verified.
+
+TEST_PORT=8003
+TEST_DIR="/tmp/rescue-resume-test"
+SERVER_SCRIPT="./server/rescue_server.py"
+UPLOADER="./templates/scripts/push_evidence.sh"
+SERVER_URL="http://localhost:$TEST_PORT"
+
+# --- Setup ---
+rm -rf "$TEST_DIR"
+mkdir -p "$TEST_DIR/server"
+cp "$SERVER_SCRIPT" "$TEST_DIR/server/rescue_server.py"
+
+echo "[*] Ensuring port $TEST_PORT is free..."
+lsof -ti :$TEST_PORT | xargs kill -9 > /dev/null 2>&1
+
+echo "[*] Starting test server..."
+(cd "$TEST_DIR" && uv run python server/rescue_server.py "$TEST_PORT") > "$TEST_DIR/server.log" 2>&1 &
+SERVER_PID=$!
+sleep 2
+
+dd if=/dev/urandom of="$TEST_DIR/disk.img" bs=1k count=3000 2>/dev/null
+ORIGINAL_HASH=$(md5 -q "$TEST_DIR/disk.img" 2>/dev/null || md5sum "$TEST_DIR/disk.img" | awk '{print $1}')
+SIZE=$(wc -c < "$TEST_DIR/disk.img" | tr -d ' ')
+
+# --- Test Execution ---
+
+# B010: Interrupted transfer resumes from the server offset
+echo "Testing B010: Resume after disconnect..."
+session=$(curl -s -X POST "$SERVER_URL/upload/start?filename=disk.img&size=$SIZE&md5=$ORIGINAL_HASH")
+upload_id=$(echo "$session" | sed -n 's/.*"upload_id": *"\([0-9a-f]*\)".*/\1/p')
+# Simulate a link that dropped after the first megabyte
+head -c 1048576 "$TEST_DIR/disk.img" | curl -s -X POST -H "Content-Type: application/octet-stream" \
+    --data-binary @- "$SERVER_URL/upload/chunk?id=$upload_id&offset=0" > /dev/null
+
+output=$(CHUNK_BYTES=524288 bash "$UPLOADER" "$TEST_DIR/disk.img" "$SERVER_URL")
+if [[ "$output" == *"Resuming upload at byte 1048576"* ]]; then
+    echo "B010: PASS"
+else
+    echo "B010: FAIL (Upload did not resume: $output)"
+    kill "$SERVER_PID"
+    exit 1
+fi
+
+# B011: Stored file matches the original
+echo "Testing B011: Integrity after resume..."
+uploaded=$(ls "$TEST_DIR/evidence/127.0.0.1/" | grep "disk.img")
+UPLOADED_HASH=$(md5 -q "$TEST_DIR/evidence/127.0.0.1/$uploaded" 2>/dev/null || md5sum "$TEST_DIR/evidence/127.0.0.1/$uploaded" | awk '{print $1}')
+if [ "$ORIGINAL_HASH" == "$UPLOADED_HASH" ]; then
+    echo "B011: PASS"
+else
+    echo "B011: FAIL (Hash mismatch! Original: $ORIGINAL_HASH, Uploaded: $UPLOADED_HASH)"
+    kill "$SERVER_PID"
+    exit 1
+fi
+
+# B012: Corrupt data is rejected at finish
+echo "Testing B012: Checksum verification..."
+session=$(curl -s -X POST "$SERVER_URL/upload/start?filename=bad.img&size=4&md5=00000000000000000000000000000000")
+upload_id=$(echo "$session" | sed -n 's/.*"upload_id": *"\([0-9a-f]*\)".*/\1/p')
+curl -s -X POST --data-binary "abcd" -H "Content-Type: application/octet-stream" \
+    "$SERVER_URL/upload/chunk?id=$upload_id&offset=0" > /dev/null
+status=$(curl -s -o /dev/null -w "%{http_code}" -X POST "$SERVER_URL/upload/finish?id=$upload_id")
+if [ "$status" == "422" ] && ! ls "$TEST_DIR/evidence/127.0.0.1/" | grep -q "bad.img"; then
+    echo "B012: PASS"
+else
+    echo "B012: FAIL (Finish returned $status)"
+    kill "$SERVER_PID"
+    exit 1
+fi
+
+# B013: A chunk past the declared size is rejected and the session still finishes
+echo "Testing B013: Chunk past declared size..."
+session=$(curl -s -X POST "$SERVER_URL/upload/start?filename=grow.log&size=4&md5=e2fc714c4727ee9395f324cd2e7f331f")
+upload_id=$(echo "$session" | sed -n 's/.*"upload_id": *"\([0-9a-f]*\)".*/\1/p')
+over=$(curl -s -o /dev/null -w "%{http_code}" -X POST --data-binary "abcdefgh" -H "Content-Type: application/octet-stream" \
+    "$SERVER_URL/upload/chunk?id=$upload_id&offset=0")
+curl -s -X POST --data-binary "abcd" -H "Content-Type: application/octet-stream" \
+    "$SERVER_URL/upload/chunk?id=$upload_id&offset=0" > /dev/null
+status=$(curl -s -o /dev/null -w "%{http_code}" -X POST "$SERVER_URL/upload/finish?id=$upload_id")
+if [ "$over" == "422" ] && [ "$status" == "201" ]; then
+    echo "B013: PASS"
+else
+    echo "B013: FAIL (Overlong chunk returned $over, finish returned $status)"
+    kill "$SERVER_PID"
+    exit 1
+fi
+
+# --- Teardown ---
+kill "$SERVER_PID"
+rm -rf "$TEST_DIR"
+echo "Resumable Upload Bridge Test Passed."
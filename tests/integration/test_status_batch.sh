@@ -0,0 +1,99 @@
+#!/usr/bin/env bash
+# Bridge Test for Batched Status Lines, Dashboard Cursors and Script Bundles
+# Goal: Verify /status/batch validation, /api/* deltas after a cursor, and /bundle 200/204 replies.
+
+TEST_PORT=8010
+TEST_DIR="/tmp/rescue-batch-test"
+SERVER_SCRIPT="./server/rescue_server.py"
+SERVER_URL="http://localhost:$TEST_PORT"
+LOG_FILE="$TEST_DIR/audit_logs/127.0.0.1/client_activity.log"
+
+fail() {
+    echo "$1"
+    kill "$SERVER_PID" 2>/dev/null
+    exit 1
+}
+
+json_get() { python3 -c "import json, sys; d = json.load(sys.stdin); print($1)"; }
+
+post_batch() {
+    curl -s -o "$TEST_DIR/reply.json" -w "%{http_code}" -X POST -H "Content-Type: application/json" \
+        --data-binary "$1" "$SERVER_URL/status/batch"
+}
+
+# --- Setup ---
+rm -rf "$TEST_DIR"
+mkdir -p "$TEST_DIR/server" "$TEST_DIR/scripts"
+cp "$SERVER_SCRIPT" "$TEST_DIR/server/rescue_server.py"
+echo "echo one" > "$TEST_DIR/scripts/one.sh"
+echo "echo two" > "$TEST_DIR/scripts/two.sh"
+
+echo "[*] Ensuring port $TEST_PORT is free..."
+lsof -ti :$TEST_PORT | xargs kill -9 > /dev/null 2>&1
+
+echo "[*] Starting test server..."
+(cd "$TEST_DIR" && uv run python server/rescue_server.py "$TEST_PORT") > "$TEST_DIR/server.log" 2>&1 &
+SERVER_PID=$!
+sleep 2
+
+# --- Test Execution ---
+
+# S001: A batch is appended to the activity log in one request
+echo "Testing S001: Batch accepted..."
+status=$(post_batch '{"lines": [{"age": 2, "text": "[AGENT] one"}, {"age": 1, "text": "[AGENT] two"}, {"text": "[AGENT] three"}]}')
+accepted=$(json_get "d['accepted']" < "$TEST_DIR/reply.json")
+if [ "$status" == "200" ] && [ "$accepted" == "3" ] && [ "$(grep -c '\[AGENT\]' "$LOG_FILE")" == "3" ]; then
+    echo "S001: PASS"
+else
+    fail "S001: FAIL (Status $status, accepted '$accepted')"
+fi
+
+# S002: Malformed or oversized batches are rejected without touching the log
+echo "Testing S002: Batch validation..."
+for body in 'not json' '{"lines": [1]}' '{"lines": [{"age": 1}]}' '{"lines": [{"age": "soon", "text": "[AGENT] x"}]}'; do
+    status=$(post_batch "$body")
+    [ "$status" == "400" ] || fail "S002: FAIL ('$body' returned $status)"
+done
+head -c 1100000 /dev/zero | tr '\0' 'a' > "$TEST_DIR/huge.json"
+status=$(post_batch "@$TEST_DIR/huge.json")
+if [ "$status" == "413" ] && [ "$(grep -c '\[AGENT\]' "$LOG_FILE")" == "3" ]; then
+    echo "S002: PASS"
+else
+    fail "S002: FAIL (Oversized batch returned $status)"
+fi
+
+# S003: Dashboard deltas only carry what changed after the cursor
+echo "Testing S003: Cursors..."
+clients=$(curl -s "$SERVER_URL/api/clients")
+cursor=$(echo "$clients" | json_get "d['cursor']")
+epoch=$(echo "$clients" | json_get "d['epoch']")
+unchanged=$(curl -s "$SERVER_URL/api/clients?since=$cursor&epoch=$epoch" | json_get "len(d['clients'])")
+post_batch '{"lines": [{"text": "[AGENT] four"}]}' > /dev/null
+changed=$(curl -s "$SERVER_URL/api/clients?since=$cursor&epoch=$epoch" | json_get "[c['ip'] for c in d['clients']]")
+feed=$(curl -s "$SERVER_URL/api/feed?since=$cursor&epoch=$epoch" | json_get "(d['reset'], len(d['lines']), d['lines'][0].endswith('four\n'))")
+if [ "$unchanged" == "0" ] && [ "$changed" == "['127.0.0.1']" ] && [ "$feed" == "(False, 1, True)" ]; then
+    echo "S003: PASS"
+else
+    fail "S003: FAIL (Unchanged: $unchanged, changed: $changed, feed: $feed)"
+fi
+
+# S004: /bundle sends every changed script, then 204 once the client holds them all
+echo "Testing S004: Script bundles..."
+status=$(curl -s -o "$TEST_DIR/bundle.tgz" -w "%{http_code}" -X POST -H "Content-Type: application/json" \
+    -d '{"have": {}}' "$SERVER_URL/bundle")
+have=$(python3 -c "
+import json, tarfile
+with tarfile.open('$TEST_DIR/bundle.tgz', 'r:gz') as tar:
+    print(json.dumps({'have': json.load(tar.extractfile('.bundle.json'))['files']}))")
+files=$(echo "$have" | json_get "sorted(d['have'])")
+second=$(curl -s -o /dev/null -w "%{http_code}" -X POST -H "Content-Type: application/json" -d "$have" "$SERVER_URL/bundle")
+if [ "$status" == "200" ] && [[ "$files" == *"scripts/one.sh"* ]] && [[ "$files" == *"scripts/two.sh"* ]] && [ "$second" == "204" ]; then
+    echo "S004: PASS"
+else
+    fail "S004: FAIL (First bundle $status with $files, second $second)"
+fi
+
+# --- Teardown ---
+kill "$SERVER_PID"
+rm -rf "$TEST_DIR"
+echo "Status Batch Bridge Test Passed."